@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+TDR2000 PAK Manager - benchmarks
+Builds a deterministic synthetic archive with TorcEngine and times the engine
+on it, printing one JSON document so runs of different versions can be diffed.
+
+    python TDR_PAK_Bench.py
+    python TDR_PAK_Bench.py --entries 50000 --depth 4 --sizes 64:4096 -o new.json
+    python TDR_PAK_Bench.py --random-fraction 1.0 --compare old.json
+    python TDR_PAK_Bench.py --codec zlib -o zlib.json && python TDR_PAK_Bench.py --compare zlib.json
+    python TDR_PAK_Bench.py --self-check
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import struct
+import fnmatch
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import zlib
+
+from TDR_PAK_Engine import (CODECS, ArchiveEngine, CompressionPolicy, TorcEngine, TrieIndex, dir_path_for,
+                            policy_summary, walk_pack_sources)
+
+BENCHMARKS = ("codec", "parse", "serialize", "lookup", "deflate", "inflate", "extract", "pack", "compact")
+
+def corpus(rng, size=1024 * 1024):
+    """Text-like bytes that deflate roughly like game scripts and configs."""
+    words = [bytes(rng.choice(b"abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9))) for _ in range(512)]
+    out = bytearray()
+    while len(out) < size:
+        out += rng.choice(words) + rng.choice((b" ", b" ", b" ", b"\n", b"=", b", "))
+    return bytes(out[:size])
+
+def synthetic_files(entries, depth, fanout, min_size, max_size, random_fraction, seed):
+    """Yields (name, payload) for a reproducible archive layout; sizes are log-uniform."""
+    rng = random.Random(seed)
+    text = corpus(rng)
+    lo, hi = math.log(min_size), math.log(max_size)
+    for i in range(entries):
+        folders = [f"dir{rng.randrange(fanout)}" for _ in range(rng.randint(0, depth))]
+        size = min(int(math.exp(rng.uniform(lo, hi))), len(text))
+        if rng.random() < random_fraction:
+            payload = rng.randbytes(size)
+        else:
+            start = rng.randrange(len(text) - size + 1)
+            payload = text[start:start + size]
+        yield "/".join(folders + [f"file{i:06d}.dat"]), payload
+
+def build(workdir, args, codec):
+    """Writes src/ (loose copies for the pack benchmark) and data.pak/.DIR with codec; returns (pak_path, files)."""
+    random.seed(args.seed)
+    src = os.path.join(workdir, "src")
+    pak_path = os.path.join(workdir, "data.pak")
+    files = []
+    with open(pak_path, "wb") as pak_file:
+        for name, payload in synthetic_files(args.entries, args.depth, args.fanout, args.min_size,
+                                             args.max_size, args.random_fraction, args.seed):
+            path = os.path.join(src, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(payload)
+            pak_file.write(b"\x00" * ((4 - pak_file.tell() % 4) % 4))
+            if args.raw_deflate:
+                packer = codec.module.compressobj(9, zlib.DEFLATED, -15)
+                block = TorcEngine.zig_header(len(payload)) + packer.compress(payload) + packer.flush()
+            else:
+                block = TorcEngine.create_zig_header(payload, not args.raw, 9, codec)
+            files.append({'name': name, 'offset': pak_file.tell(), 'size': len(block)})
+            pak_file.write(block)
+    with open(dir_path_for(pak_path), "wb") as f:
+        f.write(TorcEngine.serialize_trie_index(files))
+    return pak_path, files
+
+def check_codec(codec, files, blocks, src, level, limit=1000):
+    """
+    Byte-compatibility of the selected codec with stdlib zlib on up to limit payloads:
+    its streams must inflate with zlib, zlib's wrapped and raw deflate streams must inflate
+    with it, and the archive's blocks must decode to the source files. Returns a summary.
+    """
+    checked, mismatches = 0, []
+    for f, block in list(zip(files, blocks))[:limit]:
+        with open(os.path.join(src, f['name']), "rb") as fh:
+            payload = fh.read()
+        raw = zlib.compressobj(level, zlib.DEFLATED, -15)
+        checks = {
+            'codec->zlib': lambda: zlib.decompress(codec.compress(payload, level)),
+            'zlib->codec': lambda: codec.decompress(zlib.compress(payload, level)),
+            'raw->codec': lambda: codec.decompress(raw.compress(payload) + raw.flush(), -15),
+            'block': lambda: bytes(TorcEngine.decompress_zig(block, codec)),
+        }
+        for label, check in checks.items():
+            if check() != payload:
+                mismatches.append(f"{f['name']}: {label}")
+        checked += 1
+    return {'name': codec.name, 'installed': list(CODECS), 'checked': checked, 'mismatches': mismatches}
+
+def dict_trie_index(files_list):
+    """The original nested-dict serializer, kept as the reference for serialize_trie_index."""
+    unique_files = {f['name']: f for f in files_list}
+    tree = {}
+    for name in sorted(unique_files.keys()):
+        f = unique_files[name]
+        curr = tree
+        for i, char in enumerate(name):
+            if char not in curr: curr[char] = {'flags': 0, 'meta': None, 'children': {}}
+            if i == len(name) - 1:
+                curr[char]['flags'] |= 0x08; curr[char]['meta'] = (f['offset'], f['size'])
+            else:
+                curr[char]['flags'] |= 0x40; curr = curr[char]['children']
+    def serialize(nodes):
+        out = bytearray(); items = list(nodes.items())
+        for i, (char, info) in enumerate(items):
+            flags = info['flags']
+            if i < len(items) - 1: flags |= 0x80
+            out.append(ord(char)); out.append(flags)
+            if info['meta']: out.extend(struct.pack("<II", *info['meta']))
+            if info['children']: out.extend(serialize(info['children']))
+        return out
+    return serialize(tree)
+
+def random_names(rng, count):
+    """Paths built from a few shared segments, so names nest, prefix each other and collide."""
+    segments = ["".join(rng.choice("ab-._Z\xe9") for _ in range(rng.randint(1, 4))) for _ in range(6)]
+    return [rng.choice("/\\").join(rng.choice(segments) for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+def random_glob(rng, names):
+    """A pattern derived from one of names (or a fixed one): literals, '?', '*' and [...] sets."""
+    source = rng.choice(names) if names and rng.random() < 0.8 else "ab/Z.e"
+    pattern = []
+    for c in source:
+        roll = rng.random()
+        if roll < 0.1: pattern.append('?')
+        elif roll < 0.2: pattern.append('*')
+        elif roll < 0.25: pattern.append(rng.choice(("[%s-b]", "[!%s]", "[]%s]", "[%s", "[b-%s]")) % c)
+        elif roll < 0.3: continue
+        else: pattern.append(c)
+    if rng.random() < 0.3: pattern.append('*')
+    return "".join(pattern)
+
+def self_check(cases, seed):
+    """
+    Randomized differential checks, one random archive of up to 40 names per case:
+    serialize_trie_index must emit exactly the bytes of the dict-trie serializer, and
+    TrieIndex.search of a glob must return the names fnmatch.fnmatchcase accepts (and
+    honour limit). Returns {'cases', 'seed', 'serialize': [mismatches], 'search': [mismatches]}.
+    """
+    rng = random.Random(seed)
+    report = {'cases': cases, 'seed': seed, 'serialize': [], 'search': []}
+    for case in range(cases):
+        names = random_names(rng, rng.randint(0, 40))
+        files = [{'name': n, 'offset': rng.getrandbits(32), 'size': rng.getrandbits(32)} for n in names]
+        data = bytes(TorcEngine.serialize_trie_index(files))
+        if data != bytes(dict_trie_index(files)):
+            report['serialize'].append({'case': case, 'names': sorted(set(names))})
+        index = TrieIndex.from_bytes(data)
+        pattern = random_glob(rng, names)
+        expected = sorted(n for n in set(names) if fnmatch.fnmatchcase(n, pattern))
+        hits = [f['name'] for f in index.search(pattern)]
+        limit = rng.randint(1, 5)
+        limited = [f['name'] for f in index.search(pattern, limit=limit)]
+        if sorted(hits) != expected or limited != hits[:limit]:
+            report['search'].append({'case': case, 'pattern': pattern, 'expected': expected, 'found': hits})
+    return report
+
+def timed(repeat, func, setup=None):
+    """Best wall time of repeat runs; setup() runs untimed before each one."""
+    best, value = None, None
+    for _ in range(repeat):
+        if setup: setup()
+        started = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+def record(seconds, entries, nbytes):
+    return {'seconds': round(seconds, 6), 'entries': entries, 'bytes': nbytes,
+            'entries_per_s': round(entries / seconds, 1) if seconds else None,
+            'mb_per_s': round(nbytes / seconds / (1024 * 1024), 2) if seconds else None}
+
+def run(workdir, args):
+    engine = ArchiveEngine(workers=args.jobs or None, processes=args.processes, codec=args.codec)
+    codec = engine.codec
+    pak_path, files = build(workdir, args, codec)
+    dir_path = dir_path_for(pak_path)
+    dir_size = os.path.getsize(dir_path)
+    stored = sum(f['size'] for f in files)
+    names = sorted(f['name'] for f in files)
+    with open(pak_path, "rb") as f:
+        pak_data = f.read()
+    blocks = [pak_data[f['offset']:f['offset'] + f['size']] for f in files]
+    payload_bytes = sum(TorcEngine.parse_zig_header(b[:8])['orig_size'] for b in blocks)
+    results = {}
+    wanted = args.only or BENCHMARKS
+    codec_check = check_codec(codec, files, blocks, os.path.join(workdir, "src"), engine.level) if "codec" in wanted else None
+
+    if "parse" in wanted:
+        seconds, index = timed(args.repeat, lambda: TorcEngine.load_trie_index(dir_path))
+        assert len(index) == len(files)
+        results['parse'] = record(seconds, len(files), dir_size)
+    if "serialize" in wanted:
+        seconds, _ = timed(args.repeat, lambda: TorcEngine.serialize_trie_index(files))
+        results['serialize'] = record(seconds, len(files), dir_size)
+    if "lookup" in wanted:
+        index = TorcEngine.load_trie_index(dir_path)
+        probes = random.Random(args.seed).choices(names, k=args.lookups)
+        seconds, hits = timed(args.repeat, lambda: sum(1 for n in probes if index.lookup(n)))
+        assert hits == len(probes)
+        results['lookup'] = record(seconds, len(probes), sum(map(len, probes)))
+    if "deflate" in wanted:
+        payloads = [TorcEngine.decompress_zig(b, codec) for b in blocks]
+        seconds, _ = timed(args.repeat, lambda: [TorcEngine.create_zig_header(p, not args.raw, 9, codec)
+                                                 for p in payloads])
+        del payloads
+        results['deflate'] = record(seconds, len(files), payload_bytes)
+    if "inflate" in wanted:
+        seconds, _ = timed(args.repeat, lambda: sum(len(TorcEngine.decompress_zig(b, codec)) for b in blocks))
+        results['inflate'] = record(seconds, len(files), payload_bytes)
+    blocks.clear()   # the inflate lambda still refers to the name
+    del pak_data
+
+    out = os.path.join(workdir, "out")
+    if "extract" in wanted:
+        seconds, result = timed(args.repeat, lambda: engine.unpack_pak(pak_path, out),
+                                lambda: shutil.rmtree(out, ignore_errors=True))
+        assert not result['errors'], result['errors'][:3]
+        results['extract'] = record(seconds, result['entries'], result['bytes'])
+        shutil.rmtree(out, ignore_errors=True)
+    if "pack" in wanted:
+        new_pak = os.path.join(workdir, "packed.pak")
+        sources = list(walk_pack_sources(os.path.join(workdir, "src")))
+        compress = CompressionPolicy() if args.policy else not args.raw
+        seconds, added = timed(args.repeat, lambda: engine.pack_files(new_pak, sources, compress),
+                               lambda: engine.new_archive(new_pak))
+        results['pack'] = record(seconds, len(added), payload_bytes)
+        results['pack']['stored_bytes'] = sum(f['size'] for f in added)
+        if args.policy:
+            results['pack']['policy'] = policy_summary(added)
+    if "compact" in wanted:
+        work_pak = os.path.join(workdir, "compact.pak")
+        victims = [(n, "vfile") for n in names[::2]]
+
+        def setup():
+            shutil.copyfile(pak_path, work_pak)
+            shutil.copyfile(dir_path, dir_path_for(work_pak))
+            engine.indexes.invalidate(dir_path_for(work_pak))
+            engine.delete_entries(work_pak, victims)
+
+        seconds, result = timed(args.repeat, lambda: engine.compact_archive(work_pak), setup)
+        results['compact'] = record(seconds, result['entries'], result['new_size'])
+        results['compact']['reclaimed'] = result['reclaimed']
+    engine.close()
+
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'workers': engine.workers, 'codec': codec_check,
+            'archive': {'entries': len(files), 'dir_bytes': dir_size, 'pak_bytes': stored,
+                        'payload_bytes': payload_bytes},
+            'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+            'results': results}
+
+def compare(report, baseline_path):
+    """Prints the speedup of every benchmark against an earlier report (>1 is faster)."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)['results']
+    for name, cur in report['results'].items():
+        old = baseline.get(name)
+        if old and old['seconds'] and cur['seconds']:
+            print(f"{name:>10}: {old['seconds']:.4f}s -> {cur['seconds']:.4f}s "
+                  f"({old['seconds'] / cur['seconds']:.2f}x)", file=sys.stderr)
+
+def sizes(text):
+    lo, _, hi = text.partition(":")
+    lo, hi = int(lo), int(hi or lo)
+    if not 1 <= lo <= hi:
+        raise argparse.ArgumentTypeError("expected MIN:MAX with 1 <= MIN <= MAX")
+    return lo, hi
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the TDR2000 archive engine on a synthetic archive")
+    parser.add_argument("--entries", type=int, default=5000, help="files in the archive (default: 5000)")
+    parser.add_argument("--depth", type=int, default=3, help="maximum folder depth (default: 3)")
+    parser.add_argument("--fanout", type=int, default=8, help="folders per level (default: 8)")
+    parser.add_argument("--sizes", type=sizes, default=(256, 65536), metavar="MIN:MAX",
+                        help="log-uniform file size range in bytes (default: 256:65536)")
+    parser.add_argument("--random-fraction", type=float, default=0.0,
+                        help="share of incompressible payloads, 0-1 (default: 0)")
+    parser.add_argument("--raw", action="store_true", help="store RAW blocks instead of zIG")
+    parser.add_argument("--raw-deflate", action="store_true",
+                        help="write zIG blocks as raw deflate like the original game archives (default: zlib-wrapped)")
+    parser.add_argument("--codec", choices=("auto",) + tuple(CODECS), default="auto",
+                        help="deflate implementation (default: the fastest installed)")
+    parser.add_argument("--policy", action="store_true", help="pack benchmark: choose RAW/zIG per file (CompressionPolicy)")
+    parser.add_argument("--seed", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, best is reported (default: 3)")
+    parser.add_argument("--lookups", type=int, default=100000, help="names probed by the lookup benchmark")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="run a subset")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="engine workers (default: all cores)")
+    parser.add_argument("--processes", action="store_true", help="use worker processes instead of threads")
+    parser.add_argument("--workdir", help="build the archive here and keep it (default: a temporary folder)")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", metavar="JSON", help="print speedups against an earlier report")
+    parser.add_argument("--self-check", type=int, nargs="?", const=3000, metavar="CASES",
+                        help="run randomized serializer and glob-search checks instead of benchmarks (default: 3000 cases)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.min_size, args.max_size = args.sizes
+    del args.sizes
+    logging.basicConfig(level=logging.ERROR)
+    if args.self_check is not None:
+        report = self_check(args.self_check, args.seed)
+        print(json.dumps({k: v if k in ('cases', 'seed') else len(v) for k, v in report.items()}))
+        for kind in ('serialize', 'search'):
+            for mismatch in report[kind][:10]:
+                print(f"{kind} mismatch: {json.dumps(mismatch)}", file=sys.stderr)
+        return 1 if report['serialize'] or report['search'] else 0
+    workdir = args.workdir or tempfile.mkdtemp(prefix="tdr_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        report = run(workdir, args)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        compare(report, args.compare)
+    mismatches = report['codec']['mismatches'] if report['codec'] else []
+    for mismatch in mismatches:
+        print(f"codec {report['codec']['name']} mismatch: {mismatch}", file=sys.stderr)
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+TDR2000 PAK Manager - command line
+Headless front end over TDR_PAK_Engine for build servers and batch jobs.
+
+    python TDR_PAK_CLI.py list data.pak
+    python TDR_PAK_CLI.py extract data.pak -o out/
+    python TDR_PAK_CLI.py cat data.pak textures/car.tga --offset 12 --length 4 | xxd
+    python TDR_PAK_CLI.py pack data.pak textures/ sounds/
+    python TDR_PAK_CLI.py delete data.pak textures/old.tga sounds/
+    python TDR_PAK_CLI.py compact data.pak
+    python TDR_PAK_CLI.py mirror C:/Games/TDR2000 out/
+    python TDR_PAK_CLI.py verify C:/Games/TDR2000
+    python TDR_PAK_CLI.py stats C:/Games/TDR2000
+    python TDR_PAK_CLI.py search C:/Games/TDR2000 "data/cars/*/*.tga"
+    python TDR_PAK_CLI.py search data.pak "^sounds/.*_(l|r)\.wav$" --regex -i
+    python TDR_PAK_CLI.py --index-cache cache/ locate C:/Games/TDR2000 data/cars/ "*.tga"
+    python TDR_PAK_CLI.py --stats --stats-json mirror.json mirror C:/Games/TDR2000 out/
+"""
+
+import os
+import sys
+import time
+import json
+import pstats
+import cProfile
+import logging
+import argparse
+from contextlib import nullcontext
+
+from TDR_PAK_Engine import (CODECS, ArchiveEngine, CompressionPolicy, PhaseStats, collecting,
+                            find_archives, policy_summary, walk_pack_sources)
+
+def report(verb, entries, total, started, errors=()):
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+    for err in errors:
+        print(f"{err['archive']}: {err['name']}: {err['error']}", file=sys.stderr)
+    print(f"{verb} {entries:,} entries ({total:,} bytes) in {elapsed:.2f}s ({rate:.1f} MB/s)")
+    return 1 if errors else 0
+
+def archives_from(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from find_archives(path)
+        else:
+            yield path
+
+def cmd_list(engine, args):
+    for f in engine.list_entries(args.archive):
+        if args.long:
+            print(f"0x{f['offset']:08X} {f['size']:>12,} {f['name']}")
+        else:
+            print(f['name'])
+    return 0
+
+def cmd_extract(engine, args):
+    started = time.perf_counter()
+    output = args.output or os.path.splitext(os.path.basename(args.archive))[0]
+    files = None
+    if args.names:
+        index = engine.index(args.archive)
+        selected = {}
+        for n in args.names:
+            hit = index.lookup(n)
+            if hit: selected[hit['name']] = hit
+            for f in index.iter_prefix(n.rstrip('/') + '/'):
+                selected[f['name']] = f
+        files = list(selected.values())
+    result = engine.unpack_pak(args.archive, output, args.flatten, files)
+    return report("Extracted", result['entries'], result['bytes'], started, result['errors'])
+
+def cmd_cat(engine, args):
+    try:
+        f = engine.open_entry(args.archive, args.name)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+    with f:
+        f.seek(args.offset)
+        remaining = f.size - args.offset if args.length is None else args.length
+        while remaining > 0:
+            buf = f.read(min(remaining, engine.chunk_size))
+            if not buf: break
+            sys.stdout.buffer.write(buf)
+            remaining -= len(buf)
+    sys.stdout.buffer.flush()
+    return 0
+
+def cmd_pack(engine, args):
+    started = time.perf_counter()
+    if not os.path.exists(args.archive):
+        engine.new_archive(args.archive)
+    existing_names = {f['name'] for f in engine.list_entries(args.archive)}
+    new_files = []
+    for src_path in args.paths:
+        for file_path, rel_name in walk_pack_sources(src_path):
+            if rel_name in existing_names and args.skip_existing:
+                continue
+            new_files.append((file_path, rel_name))
+    if not new_files:
+        print("No files to pack")
+        return 0
+    engine.level = args.level
+    compress = not args.raw
+    if args.auto:
+        compress = CompressionPolicy(level=args.level, min_gain=args.min_gain / 100)
+    added = engine.pack_files(args.archive, new_files, compress, args.dedup)
+    stored = [f for f in added if not f.get('shared')]
+    report("Packed", len(stored), sum(f['size'] for f in stored), started)
+    if args.dedup:
+        print(f"Deduplicated {len(added) - len(stored):,} entries")
+    if args.auto:
+        s = policy_summary(added)
+        print(f"Policy: {s['raw']:,} of {s['files']:,} files stored RAW ({s['raw_bytes']:,} bytes, {s['by_rule']:,} by extension), "
+              f"{s['fast_level']:,} at the fast level; about {s['saved_seconds']:.2f}s of deflate skipped "
+              f"for {s['extra_bytes']:+,} bytes (sampling took {s['sample_seconds']:.2f}s)")
+    return 0
+
+def cmd_delete(engine, args):
+    targets = [(n.rstrip('/'), "vdir" if n.endswith('/') else "vfile") for n in args.names]
+    removed = engine.delete_entries(args.archive, targets)
+    print(f"Removed {removed:,} entries")
+    return 0
+
+def cmd_compact(engine, args):
+    status = 0
+    for pak_path in archives_from(args.paths):
+        try:
+            result = engine.compact_archive(pak_path)
+        except (OSError, ValueError) as e:
+            print(f"{pak_path}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        print(f"{pak_path}: {result['old_size']:,} -> {result['new_size']:,} bytes "
+              f"({result['reclaimed']:,} reclaimed, {result['blocks']:,} blocks)")
+    return status
+
+def cmd_mirror(engine, args):
+    if os.path.abspath(args.source) == os.path.abspath(args.destination):
+        print("Source and target folders must be different", file=sys.stderr)
+        return 2
+    started = time.perf_counter()
+    result = engine.mirror_recursive(args.source, args.destination, not args.no_extras,
+                                     args.incremental or args.prune, args.prune)
+    status = report("Mirrored", result['entries'], result['bytes'], started, result['errors'])
+    if 'skipped' in result:
+        print(f"Unchanged {result['skipped']:,}, removed {result['pruned']:,} stale outputs")
+    return status
+
+def cmd_verify(engine, args):
+    started = time.perf_counter()
+    reports = engine.verify_archives(list(archives_from(args.paths)))
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return 1 if any(r['errors'] for r in reports) else 0
+    for r in reports:
+        for err in r['errors']:
+            print(f"{r['archive']}: {err['name']} @0x{err['offset']:X}: {err['error']}")
+        print(f"{r['archive']}: {r['entries']:,} entries, {len(r['errors'])} bad")
+    errors = [e for r in reports for e in r['errors']]
+    elapsed = time.perf_counter() - started
+    stored = sum(r['stored'] for r in reports)
+    rate = stored / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+    print(f"Verified {len(reports)} archives, {sum(r['entries'] for r in reports):,} entries "
+          f"({stored:,} bytes) in {elapsed:.2f}s ({rate:.1f} MB/s), {len(errors)} bad")
+    return 1 if errors else 0
+
+SCAN_PROBLEMS = {'out_of_bounds': "out of bounds", 'short': "block shorter than its header",
+                 'overlapping': "overlapping"}
+
+def cmd_stats(engine, args):
+    reports = [engine.scan_archive(pak_path) for pak_path in archives_from(args.paths)]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    for r in reports if not args.json else ():
+        ratio = f"{r['ratio']:.1%}" if r['ratio'] is not None else "-"
+        print(f"{r['archive']}: {r['entries']:,} entries, {r['blocks']:,} blocks "
+              f"({r['zig']:,} zIG of which {r['wrapped']:,} zlib-wrapped, {r['raw']:,} RAW, {r['unknown']:,} unknown), "
+              f"{r['stored']:,} stored / {r['original']:,} original ({ratio}), "
+              f"{r['gap']:,} gap + {r['padding']:,} padding bytes")
+        for label, problem in SCAN_PROBLEMS.items():
+            for name in r[label]:
+                print(f"{r['archive']}: {name}: {problem}", file=sys.stderr)
+    if len(reports) > 1 and not args.json:
+        total = lambda key: sum(r[key] for r in reports)
+        print(f"Total: {len(reports)} archives, {total('entries'):,} entries, {total('stored'):,} stored / "
+              f"{total('original'):,} original, {total('gap'):,} gap bytes")
+    return 1 if any(r[label] for r in reports for label in SCAN_PROBLEMS) else 0
+
+def cmd_locate(engine, args):
+    union = engine.union_index(args.root, args.priority)
+    missing = 0
+    for query in args.queries:
+        if any(c in query for c in "*?["):
+            hits = sorted(union.search(query), key=lambda f: f['name'])
+        elif query.endswith('/'):
+            hits = sorted(union.iter_prefix(query), key=lambda f: f['name'])
+        elif args.all:
+            hits = union.lookup_all(query)
+        else:
+            hits = [f for f in (union.lookup(query),) if f]
+        if not hits:
+            print(f"{query}: not found", file=sys.stderr)
+            missing += 1
+        for f in hits:
+            print(f"{f['name']}\t{os.path.relpath(f['archive'], args.root)}")
+    return 1 if missing else 0
+
+def cmd_search(engine, args):
+    hits = engine.search(list(archives_from(args.paths)), args.pattern, args.regex, args.ignore_case, args.limit)
+    for f in hits:
+        if args.long:
+            print(f"{f['archive']}\t0x{f['offset']:08X} {f['size']:>12,} {f['name']}")
+        else:
+            print(f"{f['archive']}\t{f['name']}")
+    return 0 if hits else 1
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="TDR2000 .PAK/.DIR archive tool")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="log progress (-vv: every entry)")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="worker count (default: all cores, 1 = serial)")
+    parser.add_argument("--processes", action="store_true", help="use worker processes instead of threads")
+    parser.add_argument("--index-cache", metavar="DIR", help="keep parsed .DIR indexes in DIR between runs")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="streaming chunk size in KiB (default: 1024)")
+    parser.add_argument("--fsync", action="store_true", help="flush extracted files to disk, a batch at a time, before finishing")
+    parser.add_argument("--codec", choices=("auto",) + tuple(CODECS), default="auto",
+                        help="deflate implementation (default: the fastest installed)")
+    parser.add_argument("--stats", action="store_true", help="print time and bytes per phase when done")
+    parser.add_argument("--stats-json", metavar="FILE", help="write the per-phase stats to FILE as JSON")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="write cProfile data to FILE and print the top functions (workers are not profiled; use -j 1)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="list archive entries")
+    p.add_argument("archive")
+    p.add_argument("-l", "--long", action="store_true", help="show offsets and stored sizes")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("extract", help="extract an archive or selected entries")
+    p.add_argument("archive")
+    p.add_argument("names", nargs="*", help="entries or folders to extract (default: all)")
+    p.add_argument("-o", "--output", help="output folder (default: archive name)")
+    p.add_argument("--flatten", action="store_true", help="drop archive folders on extract")
+    p.set_defaults(func=cmd_extract)
+
+    p = sub.add_parser("cat", help="write one entry (or a byte range of it) to stdout")
+    p.add_argument("archive")
+    p.add_argument("name")
+    p.add_argument("--offset", type=int, default=0, help="first byte to write")
+    p.add_argument("--length", type=int, help="bytes to write (default: to the end)")
+    p.set_defaults(func=cmd_cat)
+
+    p = sub.add_parser("pack", help="add files or folders to an archive")
+    p.add_argument("archive")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--raw", action="store_true", help="store RAW blocks instead of zIG")
+    p.add_argument("--level", type=int, default=9, choices=range(0, 10), metavar="0-9", help="zlib level (default: 9)")
+    p.add_argument("--auto", action="store_true",
+                   help="choose RAW or zIG and the level per file from its extension and a compressed sample")
+    p.add_argument("--min-gain", type=float, default=5.0, metavar="PCT",
+                   help="with --auto, store files RAW when compression saves less than this (default: 5)")
+    p.add_argument("--skip-existing", action="store_true", help="keep entries already in the archive")
+    p.add_argument("--dedup", action="store_true", help="store identical content only once")
+    p.set_defaults(func=cmd_pack)
+
+    p = sub.add_parser("delete", help="remove entries from the index (folders end with '/')")
+    p.add_argument("archive")
+    p.add_argument("names", nargs="+")
+    p.set_defaults(func=cmd_delete)
+
+    p = sub.add_parser("compact", help="drop orphaned blocks from archives without recompressing")
+    p.add_argument("paths", nargs="+", help="archives or folders to compact")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser("mirror", help="unpack every archive under a folder")
+    p.add_argument("source")
+    p.add_argument("destination")
+    p.add_argument("--no-extras", action="store_true", help="skip loose files")
+    p.add_argument("--incremental", action="store_true", help="only extract and copy what changed since the last mirror")
+    p.add_argument("--prune", action="store_true", help="incremental, and delete outputs that no longer exist in the source")
+    p.set_defaults(func=cmd_mirror)
+
+    p = sub.add_parser("verify", help="check archives without writing output")
+    p.add_argument("paths", nargs="+", help="archives or folders to scan")
+    p.add_argument("--json", action="store_true", help="print the reports as JSON")
+    p.set_defaults(func=cmd_verify)
+
+    p = sub.add_parser("search", help="find entries by glob or regex across archives")
+    p.add_argument("paths", nargs="+", help="archives or folders to search")
+    p.add_argument("pattern", help="glob ('*' also crosses '/') or, with --regex, a regular expression")
+    p.add_argument("--regex", action="store_true", help="treat the pattern as a regular expression (anchor with '^')")
+    p.add_argument("-i", "--ignore-case", action="store_true")
+    p.add_argument("--limit", type=int, help="stop after this many hits")
+    p.add_argument("-l", "--long", action="store_true", help="show offsets and stored sizes")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("locate", help="find which archives of an install provide names, folders/ or globs")
+    p.add_argument("root", help="game folder to index")
+    p.add_argument("queries", nargs="+", help="exact names, prefixes ending in '/', or glob patterns")
+    p.add_argument("--priority", action="append", default=[], metavar="PATTERN",
+                   help="archive path pattern that overrides the rest (repeat, highest first)")
+    p.add_argument("--all", action="store_true", help="for exact names, also list shadowed copies")
+    p.set_defaults(func=cmd_locate)
+
+    p = sub.add_parser("stats", help="summarise block types, sizes and wasted space from the headers alone")
+    p.add_argument("paths", nargs="+", help="archives or folders to scan")
+    p.add_argument("--json", action="store_true", help="print the reports as JSON")
+    p.set_defaults(func=cmd_stats)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    levels = (logging.WARNING, logging.INFO, logging.DEBUG)
+    logging.basicConfig(level=levels[min(args.verbose, 2)], format='%(asctime)s [%(levelname)s] %(message)s')
+    engine = ArchiveEngine(workers=args.jobs or None, processes=args.processes,
+                           chunk_size=max(1, args.chunk_size) * 1024, cache_dir=args.index_cache, fsync=args.fsync,
+                           codec=args.codec)
+    logging.info(f"Deflate codec: {engine.codec.name}")
+    stats = PhaseStats() if args.stats or args.stats_json else None
+    profiler = cProfile.Profile() if args.profile else None
+
+    with collecting(stats) if stats else nullcontext():
+        if profiler: profiler.enable()
+        try:
+            status = args.func(engine, args)
+        finally:
+            if profiler: profiler.disable()
+
+    if profiler:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(20)
+    if args.stats:
+        print(stats.summary(), file=sys.stderr)
+    if args.stats_json:
+        with open(args.stats_json, "w", encoding="utf-8") as f:
+            json.dump({'command': args.command, 'status': status, **stats.as_dict()}, f, indent=2)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
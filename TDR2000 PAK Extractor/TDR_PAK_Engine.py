@@ -0,0 +1,2461 @@
+# -*- coding: utf-8 -*-
+"""
+TDR2000 PAK Engine
+GUI-free archive operations for Torc Engine .PAK/.DIR archives.
+Shared by the Tk manager (TDR_PAK_Manager.py) and the command line (TDR_PAK_CLI.py).
+"""
+
+import io
+import os
+import re
+import mmap
+import bisect
+import fnmatch
+import struct
+import zlib
+import json
+import time
+import pickle
+import shutil
+import random
+import hashlib
+import logging
+import threading
+from array import array
+from itertools import islice, compress
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+BATCH_ENTRIES = 256
+BATCH_BYTES = 8 * 1024 * 1024
+MAX_OPEN_READERS = 32
+INDEX_CACHE_SIZE = 64
+STREAM_CHUNK = 1024 * 1024
+CHECKPOINT_INTERVAL = 1024 * 1024
+STREAM_PACK_SIZE = 16 * 1024 * 1024
+# already-compressed formats that CompressionPolicy stores RAW without sampling
+STORE_EXTENSIONS = frozenset(".ogg .mp3 .wma .jpg .jpeg .png .bik .bk2 .avi .mp4 .wmv .zip .gz .7z .rar .cab".split())
+MANIFEST_NAME = ".tdr_mirror.json"
+
+class DeflateCodec:
+    """
+    One deflate implementation behind the stdlib zlib signatures (compress, decompress,
+    compressobj, decompressobj) and its exception type. Backends with fewer levels than
+    zlib's 0-9 (ISA-L has 0-3) get the level scaled onto their range.
+    """
+
+    def __init__(self, name, module, max_level=9):
+        self.name = name
+        self.module = module
+        self.error = module.error
+        self.max_level = max_level
+
+    def __repr__(self):
+        return f"DeflateCodec({self.name!r})"
+
+    def __reduce__(self):
+        # modules do not pickle; process workers look the codec up by name instead
+        return (get_codec, (self.name,))
+
+    def level(self, level):
+        return level if self.max_level == 9 else min(self.max_level, (level + 1) // 3)
+
+    def compress(self, data, level=9):
+        return self.module.compress(data, self.level(level))
+
+    def decompress(self, data, wbits=zlib.MAX_WBITS):
+        return self.module.decompress(data, wbits)
+
+    def compressobj(self, level=9):
+        return self.module.compressobj(self.level(level))
+
+    def decompressobj(self, wbits=zlib.MAX_WBITS):
+        return self.module.decompressobj(wbits)
+
+def installed_codecs():
+    """Every importable deflate backend by name, fastest first; stdlib 'zlib' is always last."""
+    codecs = {}
+    try:
+        from zlib_ng import zlib_ng
+        codecs['zlib-ng'] = DeflateCodec('zlib-ng', zlib_ng)
+    except ImportError:
+        pass
+    try:
+        from isal import isal_zlib
+        codecs['isal'] = DeflateCodec('isal', isal_zlib, isal_zlib.ISAL_BEST_COMPRESSION)
+    except ImportError:
+        pass
+    codecs['zlib'] = DeflateCodec('zlib', zlib)
+    return codecs
+
+CODECS = installed_codecs()
+# caught wherever a block is inflated, whichever backend raised
+DEFLATE_ERRORS = tuple({codec.error for codec in CODECS.values()})
+
+def get_codec(name=None):
+    """The DeflateCodec called 'zlib-ng', 'isal' or 'zlib', or None/'auto' for the first installed."""
+    if name in (None, "auto"):
+        name = next(iter(CODECS))
+    if name not in CODECS:
+        raise ValueError(f"deflate codec {name!r} is not installed (available: {', '.join(CODECS)})")
+    return CODECS[name]
+
+def set_codec(name=None):
+    """
+    Changes the process-wide default codec (see get_codec), used wherever no codec is passed
+    in. ArchiveEngine keeps its own and does not touch this. Returns the DeflateCodec.
+    """
+    TorcEngine.codec = get_codec(name)
+    return TorcEngine.codec
+
+class TorcEngine:
+    codec = next(iter(CODECS.values()))  # default when no codec is passed; see set_codec
+
+    @staticmethod
+    def rotate_right8(val, bits):
+        return ((val >> bits) | (val << (8 - bits))) & 0xFF
+
+    @staticmethod
+    def create_zig_header(data, compress=True, level=9, codec=None):
+        """
+        zIG format: [key:u8][sig_encrypted:3bytes][size_encrypted:u32][payload]
+        sig = "zIG" (compressed) or "RAW" (uncompressed)
+        size = original uncompressed size
+        meta_key = ror8(key, 3) used for size encryption
+        codec defaults to TorcEngine.codec, here and in the other block helpers.
+        """
+        key = random.randint(1, 254)
+        final_data = (codec or TorcEngine.codec).compress(data, level) if compress else data
+        return TorcEngine.zig_header(len(data), compress, key) + final_data
+
+    @staticmethod
+    def zig_header(orig_size, compress=True, key=None):
+        """The 8-byte zIG/RAW header alone, for writers that stream the payload after it."""
+        if key is None: key = random.randint(1, 254)
+        sig = b"zIG" if compress else b"RAW"
+        header = bytearray([key])
+        for b in sig: header.append(b ^ key)
+        meta_key = TorcEngine.rotate_right8(key, 3)
+        header.extend([b ^ meta_key for b in struct.pack("<I", orig_size)])
+        return header
+
+    @staticmethod
+    def parse_zig_header(h):
+        """Decodes the 8-byte block header from any buffer: {'sig', 'orig_size', 'key'} or None."""
+        if len(h) < 8: return None
+        key = h[0]; meta_key = TorcEngine.rotate_right8(key, 3)
+        sig = bytes([h[1]^key, h[2]^key, h[3]^key])
+        orig_sz = struct.unpack("<I", bytes([h[i]^meta_key for i in range(4, 8)]))[0]
+        return {"sig": sig, "orig_size": orig_sz, "key": key}
+
+    @staticmethod
+    def deflate_variants(payload):
+        """
+        wbits to inflate a zIG payload with, likeliest first. Original archives hold raw
+        deflate (-15) while this tool writes the zlib wrapper, and one archive may mix both
+        once packed into, so the variant is read per block from the first two bytes: a valid
+        zlib header (CM=8, no preset dictionary, FCHECK) means wrapped. The other variant is
+        only tried if the likelier one fails.
+        """
+        if (len(payload) >= 2 and payload[0] & 0x0F == 8 and payload[0] >> 4 <= 7
+                and not payload[1] & 0x20 and (payload[0] << 8 | payload[1]) % 31 == 0):
+            return (zlib.MAX_WBITS, -15)
+        return (-15, zlib.MAX_WBITS)
+
+    @staticmethod
+    def decompress_zig(raw_data, codec=None):
+        """
+        Returns the payload of a zIG/RAW block. raw_data may be any buffer (e.g. a PakReader
+        slice); the deflate input and RAW payloads are memoryviews over it, not copies.
+        """
+        if len(raw_data) < 8: return raw_data
+        view = memoryview(raw_data)
+        key = view[0]
+        sig = bytes([view[1]^key, view[2]^key, view[3]^key])
+        if sig == b"RAW": return view[8:]
+        if sig != b"zIG": return raw_data
+        payload = view[8:]
+        codec = codec or TorcEngine.codec
+        first, second = TorcEngine.deflate_variants(payload)
+        try: return codec.decompress(payload, first)
+        except DEFLATE_ERRORS as e:
+            logging.debug(f"zIG decompression failed (wbits={first}): {e}")
+            try: return codec.decompress(payload, second)
+            except DEFLATE_ERRORS as e2:
+                logging.error(f"zIG decompression failed (wbits={second}): {e2}")
+                return raw_data
+
+    @staticmethod
+    def iter_inflate(payload, wbits=-15, chunk_size=STREAM_CHUNK, codec=None):
+        """
+        Incrementally inflates a deflate stream, yielding pieces of at most chunk_size bytes
+        while reading at most chunk_size bytes of input at a time.
+        Raises one of DEFLATE_ERRORS on corrupt or truncated input, like zlib.decompress.
+        """
+        d = (codec or TorcEngine.codec).decompressobj(wbits)
+        for pos in range(0, len(payload), chunk_size):
+            data = payload[pos:pos + chunk_size]
+            while data:
+                out = d.decompress(data, chunk_size)
+                if out: yield out
+                data = d.unconsumed_tail
+            if d.eof: break
+        out = d.flush()
+        if out: yield out
+        if not d.eof:
+            raise zlib.error("incomplete or truncated stream")
+
+    @staticmethod
+    def stream_zig(raw_data, sink, chunk_size=STREAM_CHUNK, codec=None):
+        """
+        Streaming counterpart of decompress_zig: writes the payload of a block into sink
+        (a binary file or a write callable) holding only a few chunk_size buffers at once.
+        The deflate variant is taken from the payload (deflate_variants); inflation falls
+        back to the other variant, and to the raw block when both fail. A sink that cannot
+        seek only falls back while nothing has been written to it; otherwise zlib.error is
+        raised. Returns the number of bytes written.
+        """
+        write = sink if callable(sink) else sink.write
+        view = memoryview(raw_data)
+
+        def copy(buf):
+            for pos in range(0, len(buf), chunk_size):
+                write(buf[pos:pos + chunk_size])
+            return len(buf)
+
+        info = TorcEngine.parse_zig_header(view)
+        if info is None or info['sig'] not in (b"zIG", b"RAW"): return copy(view)
+        if info['sig'] == b"RAW": return copy(view[8:])
+
+        start = sink.tell() if hasattr(sink, "seek") else None
+        written = 0
+        for wbits, level in zip(TorcEngine.deflate_variants(view[8:]), (logging.DEBUG, logging.ERROR)):
+            if written:
+                if start is None: raise zlib.error(f"zIG stream failed after {written} bytes")
+                sink.seek(start); sink.truncate(); written = 0
+            try:
+                for out in TorcEngine.iter_inflate(view[8:], wbits, chunk_size, codec):
+                    write(out); written += len(out)
+                return written
+            except DEFLATE_ERRORS as e:
+                logging.log(level, f"zIG decompression failed (wbits={wbits}): {e}")
+        if written:
+            if start is None: raise zlib.error(f"zIG stream failed after {written} bytes")
+            sink.seek(start); sink.truncate()
+        return copy(view)
+
+    @staticmethod
+    def get_zig_metadata(pak_path, offset, size):
+        try:
+            with open(pak_path, "rb") as f:
+                f.seek(offset); info = TorcEngine.parse_zig_header(f.read(8))
+                return {"orig_size": info['orig_size'], "key": info['key']} if info else None
+        except Exception as e:
+            logging.error(f"Failed to read zIG metadata at {pak_path}+0x{offset:X}: {e}")
+            return None
+
+    @staticmethod
+    def load_trie_index(path):
+        """Reads a .DIR into a TrieIndex; missing or unreadable files give an empty index."""
+        if not os.path.exists(path): return TrieIndex(path)
+        try:
+            with open(path, "rb") as f: data = f.read()
+        except Exception as e:
+            logging.error(f"Failed to read trie index {path}: {e}")
+            return TrieIndex(path)
+        started = time.perf_counter()
+        index = TrieIndex.from_bytes(data, path)
+        stats = current_stats()
+        if stats: stats.add("index", time.perf_counter() - started, len(data))
+        logging.info(f"Parsed {len(index)} files from {path}")
+        return index
+
+    @staticmethod
+    def parse_trie_index(path):
+        """
+        Trie format: recursive structure of [char:u8][flags:u8][offset:u32,size:u32]?
+        flags: 0x08=file_entry, 0x40=has_children, 0x80=has_sibling
+        """
+        return TorcEngine.load_trie_index(path).entries()
+
+    @staticmethod
+    def serialize_trie_index(files_list):
+        """
+        Emits the trie straight from the sorted name list: each name only adds nodes for the
+        part it does not share with its predecessor, flags of earlier nodes are patched in
+        place (0x40 when a child follows, 0x80 when a sibling follows), and everything is
+        written into one buffer sized up front. Later duplicates of a name win.
+        """
+        unique_files = {f['name']: f for f in files_list}
+        names = [n.encode('latin-1') for n in sorted(unique_files) if n]
+        metas = [unique_files[n.decode('latin-1')] for n in names]
+
+        lcps, total, prev = [], 0, b""
+        for name in names:
+            # common prefix length from the highest differing byte of the XORed prefixes
+            m = min(len(prev), len(name))
+            diff = int.from_bytes(prev[:m], 'big') ^ int.from_bytes(name[:m], 'big')
+            lcp = m - (diff.bit_length() + 7) // 8
+            lcps.append(lcp)
+            total += 2 * (len(name) - lcp) + 8
+            prev = name
+
+        out = bytearray(total)
+        pack_meta = struct.Struct("<II").pack_into
+        flag_pos = []     # position of the flags byte of each node on the current path
+        pos, prev_len = 0, 0
+        for name, f, lcp in zip(names, metas, lcps):
+            if lcp < prev_len: out[flag_pos[lcp]] |= 0x80
+            del flag_pos[lcp:]
+            if lcp: out[flag_pos[lcp - 1]] |= 0x40
+            count = len(name) - lcp
+            end = pos + 2 * count
+            out[pos:end:2] = name[lcp:]
+            out[pos + 1:end:2] = b"\x40" * (count - 1) + b"\x08"
+            flag_pos.extend(range(pos + 1, end, 2))
+            pack_meta(out, end, f['offset'], f['size'])
+            pos, prev_len = end + 8, len(name)
+        return out
+
+# Header decoding tables for bulk scans: the first 4 header bytes (key + encrypted
+# signature) of every possible key, and the u32 mask that decrypts the size field.
+HEADER_SIGS = {bytes([key] + [c ^ key for c in sig]): sig for sig in (b"zIG", b"RAW") for key in range(256)}
+SIZE_MASKS = array('I', (TorcEngine.rotate_right8(key, 3) * 0x01010101 for key in range(256)))
+
+def glob_tokens(pattern):
+    """
+    Splits an fnmatch pattern into tokens: '*', '?', (charset, negated) for [...] and
+    single literal characters. '[' without a closing ']' is a literal, as in fnmatch.
+    """
+    tokens, i, n = [], 0, len(pattern)
+    while i < n:
+        c = pattern[i]; i += 1
+        if c == '*':
+            if not tokens or tokens[-1] != '*': tokens.append('*')
+        elif c == '?':
+            tokens.append('?')
+        elif c == '[':
+            j = i + (i < n and pattern[i] == '!')
+            j += j < n and pattern[j] == ']'
+            while j < n and pattern[j] != ']': j += 1
+            if j >= n:
+                tokens.append('['); continue
+            body, i = pattern[i:j], j + 1
+            negated = body.startswith('!')
+            if negated: body = body[1:]
+            chars, k = set(), 0
+            while k < len(body):
+                if k + 2 < len(body) and body[k+1] == '-':
+                    chars.update(map(chr, range(ord(body[k]), ord(body[k+2]) + 1))); k += 3
+                else:
+                    chars.add(body[k]); k += 1
+            tokens.append((frozenset(chars), negated))
+        else:
+            tokens.append(c)
+    return tokens
+
+def regex_prefix(pattern):
+    """
+    Literal text every match of a '^'-anchored regex must start with ('' when unanchored
+    or alternated at the top level), used to jump straight to that subtree of the trie.
+    """
+    if not pattern.startswith('^') or '|' in pattern: return ""
+    prefix, i = [], 1
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern) and not pattern[i+1].isalnum():
+            literal, i = pattern[i+1], i + 2
+        elif c in ".^$*+?{}[]\\()":
+            break
+        else:
+            literal, i = c, i + 1
+        if i < len(pattern) and pattern[i] in "*?{":
+            break  # quantified: the character is optional or repeated
+        prefix.append(literal)
+    return "".join(prefix)
+
+# Run of .DIR nodes that only link to a single child (flags == 0x40).
+_LINK_RUN = re.compile(rb'(?:.\x40)+', re.S)
+
+
+class TrieIndex:
+    """
+    Decoded .DIR kept in parallel arrays instead of one dict per file.
+    Nodes store char/flags/first child/next sibling/entry id, entries store
+    name/offset/size, so lookup() walks the trie in O(L) and iter_prefix()
+    only visits the subtree under the prefix.
+    """
+    __slots__ = ('path', 'names', 'offsets', 'sizes', '_chars', '_child', '_next', '_entry')
+
+    def __init__(self, path=None):
+        self.path = path
+        self.names = []
+        self.offsets = array('I')
+        self.sizes = array('I')
+        self._chars = bytearray()
+        self._child = array('i')
+        self._next = array('i')
+        self._entry = array('i')
+
+    @classmethod
+    def from_bytes(cls, data, path=None):
+        """
+        Single iterative pass over the trie; deep paths cannot hit the recursion limit.
+        Every node takes at least two bytes, so the node arrays are allocated once at
+        len(data)//2 and trimmed afterwards; a node's first child is always the next
+        node, so _child starts out as n+1 and is only cleared at leaves. Most nodes are
+        plain links (one child, no entry, no sibling) and runs of those are matched by
+        one regex and sliced in at C speed. The current path is one bytearray that is
+        only decoded at entry nodes.
+        """
+        index = cls(path)
+        cap = len(data) // 2
+        chars = bytearray(cap)
+        child = array('i', range(1, cap + 1))   # first child is the next node unless cleared
+        nxt = array('i', [-1]) * cap
+        entry = array('i', [-1]) * cap
+        names, offsets, sizes = index.names, index.offsets, index.sizes
+        unpack = struct.Struct("<II").unpack_from
+        links = _LINK_RUN.match
+        stack = []        # (node, path length) of open branches that still have a sibling
+        key = bytearray(b"\0")  # path so far, last byte belongs to the current node
+        prev = -1
+        count = 0
+        pos, end = 0, len(data)
+        while pos + 2 <= end:
+            node = count
+            if prev >= 0: nxt[prev] = node; prev = -1
+            c = data[pos]; flags = data[pos+1]
+            if flags == 0x40:
+                stop = links(data, pos).end(); k = (stop - pos) >> 1
+                chars[node:node+k] = data[pos:stop:2]
+                del key[-1]; key += data[pos:stop:2]; key.append(0)
+                count += k; pos = stop
+                continue
+            pos += 2
+            count += 1
+            chars[node] = c; key[-1] = c
+            if flags & 0x08:
+                if pos + 8 > end: child[node] = -1; break
+                off, sz = unpack(data, pos); pos += 8
+                entry[node] = len(names)
+                names.append(key.decode('latin-1')); offsets.append(off); sizes.append(sz)
+            if flags & 0x40:
+                if flags & 0x80: stack.append((node, len(key)))
+                key.append(0)
+                continue
+            child[node] = -1
+            if flags & 0x80:
+                prev = node
+            elif stack:
+                prev, depth = stack.pop()
+                del key[depth:]
+            else:
+                break
+        if count and child[count-1] == count: child[count-1] = -1   # data ended mid-branch
+        del chars[count:], child[count:], nxt[count:], entry[count:]
+        index._chars, index._child, index._next, index._entry = chars, child, nxt, entry
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        """Yields (name, offset, size) in index order."""
+        return zip(self.names, self.offsets, self.sizes)
+
+    def entry(self, i):
+        return {'name': self.names[i], 'offset': self.offsets[i], 'size': self.sizes[i]}
+
+    def entries(self):
+        return [{'name': n, 'offset': o, 'size': s} for n, o, s in self]
+
+    def _find(self, path):
+        """Node index reached by path, or -1."""
+        try:
+            key = path.encode('latin-1')
+        except UnicodeEncodeError:
+            return -1
+        node = 0 if self._chars else -1
+        for depth, c in enumerate(key):
+            if depth: node = self._child[node]
+            while node >= 0 and self._chars[node] != c:
+                node = self._next[node]
+            if node < 0: return -1
+        return node
+
+    def lookup(self, name):
+        """{'name', 'offset', 'size'} of an exact path, or None."""
+        node = self._find(name) if name else -1
+        if node < 0 or self._entry[node] < 0: return None
+        return self.entry(self._entry[node])
+
+    def __contains__(self, name):
+        return self.lookup(name) is not None
+
+    def _walk(self, first):
+        """Entry ids in the subtree hanging off node first (first and its siblings), in index order."""
+        stack = [first]
+        while stack:
+            node = stack.pop()
+            if node < 0: continue
+            if self._entry[node] >= 0: yield self._entry[node]
+            stack.append(self._next[node])
+            stack.append(self._child[node])
+
+    def iter_prefix(self, prefix):
+        """Yields entries whose name starts with prefix ('' lists everything)."""
+        if not prefix:
+            ids = self._walk(0 if self._chars else -1)
+        else:
+            node = self._find(prefix)
+            if node < 0: return
+            if self._entry[node] >= 0: yield self.entry(self._entry[node])
+            ids = self._walk(self._child[node])
+        for i in ids:
+            yield self.entry(i)
+
+    def search(self, pattern, regex=False, ignore_case=False, limit=None):
+        """
+        Entries whose name matches a glob (fnmatch rules, '*' also crosses '/') or, with
+        regex=True, a regular expression found anywhere in the name (anchor with '^').
+        Globs walk the trie with a small NFA of the pattern and drop every subtree where
+        no state survives; a literal lead-in jumps straight to its node, and once only a
+        trailing '*' is left the subtree is taken whole. Patterns that cannot prune
+        (leading '*', unanchored regexes) are matched over the name list in C instead.
+        """
+        flags = re.IGNORECASE if ignore_case else 0
+        if regex:
+            match = re.compile(pattern, flags).search
+            prefix = "" if ignore_case else regex_prefix(pattern)
+            if not prefix:
+                return self._scan(match, limit)
+            return list(islice((f for f in self.iter_prefix(prefix) if match(f['name'])), limit))
+
+        tokens = glob_tokens(pattern.lower() if ignore_case else pattern)
+        if not tokens or tokens[0] == '*':
+            return self._scan(re.compile(fnmatch.translate(pattern), flags).match, limit)
+        return [self.entry(i) for i in islice(self._glob_ids(tokens, ignore_case), limit)]
+
+    def _scan(self, match, limit=None):
+        """Entries whose name satisfies match, tested over the whole name list at C speed."""
+        ids = compress(range(len(self.names)), map(match, self.names))
+        return [self.entry(i) for i in islice(ids, limit)]
+
+    def _glob_ids(self, tokens, ignore_case):
+        """Entry ids matched by glob tokens, in index order."""
+        accept = len(tokens)
+        tail = frozenset((accept - 1, accept)) if tokens[-1] == '*' else None
+        transitions = {}
+
+        def closure(states):
+            out = set(states)
+            for i in sorted(states):
+                while i < accept and tokens[i] == '*':
+                    i += 1; out.add(i)
+            return frozenset(out)
+
+        def step(states, c):
+            key = (states, c)
+            if key not in transitions:
+                nxt_states = set()
+                for i in states:
+                    if i == accept: continue
+                    t = tokens[i]
+                    if t == '*':
+                        nxt_states.add(i)
+                    elif isinstance(t, tuple):
+                        if (c in t[0]) != t[1]: nxt_states.add(i + 1)
+                    elif t == '?' or t == c:
+                        nxt_states.add(i + 1)
+                transitions[key] = closure(nxt_states)
+            return transitions[key]
+
+        chars, child, nxt, entry = self._chars, self._child, self._next, self._entry
+        lead = 0
+        if not ignore_case:
+            while lead < accept and isinstance(tokens[lead], str) and tokens[lead] not in '*?' : lead += 1
+        states = closure({lead})
+        if lead:
+            node = self._find("".join(tokens[:lead]))
+            if node < 0: return
+            if accept in states and entry[node] >= 0: yield entry[node]
+            if states == tail:
+                yield from self._walk(child[node]); return
+            stack = [(child[node], states)]
+        else:
+            stack = [(0 if chars else -1, states)]
+        lower = str.lower if ignore_case else None
+        while stack:
+            node, states = stack.pop()
+            if node < 0: continue
+            stack.append((nxt[node], states))
+            c = chr(chars[node])
+            new = step(states, lower(c) if lower else c)
+            if not new: continue
+            if accept in new and entry[node] >= 0: yield entry[node]
+            if new == tail:
+                yield from self._walk(child[node])
+            else:
+                stack.append((child[node], new))
+
+    def list_dir(self, prefix=""):
+        """
+        Immediate children of a virtual folder as (folder names, entries), both sorted.
+        prefix is '' for the root or a folder path ending in '/'. The walk stops at the
+        next '/' of every name, so a folder opens in time proportional to its own
+        listing, not to everything beneath it.
+        """
+        if prefix:
+            node = self._find(prefix)
+            if node < 0: return [], []
+            first = self._child[node]
+        else:
+            first = 0 if self._chars else -1
+        chars, child, nxt, entry = self._chars, self._child, self._next, self._entry
+        slash = ord('/')
+        folders, ids = set(), []
+        stack = [(first, b"")]
+        while stack:
+            node, segment = stack.pop()
+            if node < 0: continue
+            stack.append((nxt[node], segment))
+            if chars[node] == slash:
+                folders.add(segment.decode('latin-1'))
+                continue
+            segment += bytes((chars[node],))
+            if entry[node] >= 0: ids.append(entry[node])
+            stack.append((child[node], segment))
+        files = sorted((self.entry(i) for i in ids), key=lambda f: f['name'])
+        return sorted(folders), files
+
+class IndexCache:
+    """
+    Parsed TrieIndex objects keyed by the .DIR's absolute path, size and mtime.
+    Keeps an in-process LRU and, when cache_dir is set, a pickle per index on disk
+    so later runs skip the parse too. Cached indexes are shared: treat them as read-only.
+    """
+
+    def __init__(self, capacity=INDEX_CACHE_SIZE, cache_dir=None):
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _key(dir_path):
+        try:
+            st = os.stat(dir_path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def _disk_path(self, path):
+        return os.path.join(self.cache_dir, hashlib.sha1(path.encode('utf-8')).hexdigest() + ".idx")
+
+    def _load_disk(self, path, key):
+        try:
+            with open(self._disk_path(path), "rb") as f:
+                stored_path, stored_key, index = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, ValueError, TypeError):
+            return None
+        return index if (stored_path, stored_key) == (path, key) else None
+
+    def _store_disk(self, path, key, index):
+        disk_path = self._disk_path(path)
+        try:
+            with open(disk_path + ".tmp", "wb") as f:
+                pickle.dump((path, key, index), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(disk_path + ".tmp", disk_path)
+        except OSError as e:
+            logging.warning(f"Failed to write index cache for {path}: {e}")
+
+    def get(self, dir_path):
+        path = os.path.abspath(dir_path)
+        key = self._key(path)
+        if key is None:
+            return TrieIndex(dir_path)
+        with self._lock:
+            hit = self._items.get(path)
+            if hit is not None and hit[0] == key:
+                self._items.move_to_end(path)
+                return hit[1]
+        index = self._load_disk(path, key) if self.cache_dir else None
+        if index is None:
+            index = TorcEngine.load_trie_index(dir_path)
+            if self.cache_dir: self._store_disk(path, key, index)
+        with self._lock:
+            self._items[path] = (key, index)
+            self._items.move_to_end(path)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+        return index
+
+    def peek(self, dir_path):
+        """The index held in memory while the .DIR is unchanged, else None; never parses."""
+        path = os.path.abspath(dir_path)
+        key = self._key(path)
+        with self._lock:
+            hit = self._items.get(path)
+        return hit[1] if hit is not None and hit[0] == key else None
+
+    def invalidate(self, dir_path):
+        path = os.path.abspath(dir_path)
+        with self._lock:
+            self._items.pop(path, None)
+        if self.cache_dir:
+            try:
+                os.remove(self._disk_path(path))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+def dir_path_for(pak_path):
+    return pak_path[:-4] + ".dir"
+
+def archive_bases(items):
+    """Lower-cased base names of every .dir in a directory listing."""
+    return {i.lower()[:-4] for i in items if i.lower().endswith(".dir")}
+
+def is_archive(item, dir_files):
+    base = item.lower()[:-4] if item.lower().endswith(".pak") else None
+    return bool(base and base in dir_files)
+
+def find_archives(root):
+    """Yields every .pak under root that has a matching .dir, in a stable order."""
+    for dirpath, dirnames, items in os.walk(root):
+        dirnames.sort()
+        dir_files = archive_bases(items)
+        for item in sorted(items):
+            if is_archive(item, dir_files):
+                yield os.path.join(dirpath, item)
+
+class UnionIndex:
+    """
+    Every name provided by the archives under root, and which archive wins for it.
+    Archives are ranked by the first fnmatch pattern in priority (relative paths, highest
+    first) they match, unmatched ones last, ties in find_archives order; the best-ranked
+    archive holding a name provides it. save()/load() persist the parsed indexes and
+    refresh() only reparses archives whose .DIR changed, so opening a known install
+    costs one unpickle and a stat per archive.
+    """
+
+    def __init__(self, root, priority=(), path=None):
+        self.root = os.path.abspath(root)
+        self.priority = list(priority)
+        self.path = path
+        self.archives = []      # (pak_path, dir key, TrieIndex), best rank first
+        self.providers = {}     # name -> position in archives
+
+    def _rank(self, pak_path):
+        rel = os.path.relpath(pak_path, self.root).replace(os.sep, '/')
+        for rank, pattern in enumerate(self.priority):
+            if fnmatch.fnmatch(rel, pattern):
+                return rank
+        return len(self.priority)
+
+    def refresh(self, load_index=None):
+        """
+        Rescans root: new archives are parsed, changed .DIRs reparsed, missing ones dropped.
+        Returns {'added', 'changed', 'removed', 'unchanged'}.
+        """
+        load_index = load_index or (lambda pak_path: TorcEngine.load_trie_index(dir_path_for(pak_path)))
+        known = {pak_path: (key, index) for pak_path, key, index in self.archives}
+        counts = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+        found = {pak_path: order for order, pak_path in enumerate(find_archives(self.root))}
+        archives = []
+        for pak_path in sorted(found, key=lambda p: (self._rank(p), found[p])):
+            key = IndexCache._key(dir_path_for(pak_path))
+            old = known.pop(pak_path, None)
+            if old and old[0] == key:
+                archives.append((pak_path, key, old[1])); counts['unchanged'] += 1
+            else:
+                archives.append((pak_path, key, load_index(pak_path)))
+                counts['changed' if old else 'added'] += 1
+        counts['removed'] = len(known)
+        self.archives = archives
+        providers = {}
+        for slot in range(len(archives) - 1, -1, -1):
+            providers.update(dict.fromkeys(archives[slot][2].names, slot))
+        self.providers = providers
+        return counts
+
+    def load(self):
+        """
+        Restores the indexes saved for this root; False when there are none. Ranking is
+        redone by refresh(), so a saved union serves any priority.
+        """
+        if not self.path: return False
+        try:
+            with open(self.path, "rb") as f:
+                root, archives = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, ValueError, TypeError):
+            return False
+        if root != self.root: return False
+        self.archives = archives
+        return True
+
+    def save(self):
+        if not self.path: return
+        try:
+            with open(self.path + ".tmp", "wb") as f:
+                pickle.dump((self.root, self.archives), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            logging.warning(f"Failed to write union index {self.path}: {e}")
+
+    def __len__(self):
+        return len(self.providers)
+
+    def __contains__(self, name):
+        return name in self.providers
+
+    def lookup(self, name):
+        """{'archive', 'name', 'offset', 'size'} of the providing archive, or None."""
+        slot = self.providers.get(name)
+        if slot is None: return None
+        pak_path, _, index = self.archives[slot]
+        return dict(index.lookup(name), archive=pak_path)
+
+    def lookup_all(self, name):
+        """Every archive holding name, provider first, shadowed copies after."""
+        hits = []
+        for pak_path, _, index in self.archives:
+            f = index.lookup(name)
+            if f: hits.append(dict(f, archive=pak_path))
+        return hits
+
+    def iter_prefix(self, prefix):
+        """Provided entries whose name starts with prefix, grouped by archive."""
+        for slot, (pak_path, _, index) in enumerate(self.archives):
+            for f in index.iter_prefix(prefix):
+                if self.providers[f['name']] == slot:
+                    f['archive'] = pak_path
+                    yield f
+
+    def search(self, pattern, regex=False, ignore_case=False, limit=None):
+        """Provided entries matching a glob or regex (see TrieIndex.search), grouped by archive."""
+        hits = []
+        for slot, (pak_path, _, index) in enumerate(self.archives):
+            for f in index.search(pattern, regex, ignore_case):
+                if self.providers[f['name']] == slot:
+                    f['archive'] = pak_path
+                    hits.append(f)
+                    if limit is not None and len(hits) >= limit: return hits
+        return hits
+
+def safe_entry_path(name, flatten=False):
+    safe_name = os.path.normpath(name).lstrip(os.sep).replace('..', '__')
+    if flatten:
+        safe_name = os.path.basename(safe_name)
+    return safe_name.replace("/", os.sep)
+
+def walk_pack_sources(src_path):
+    """
+    Yields (file_path, rel_name) for a file or folder to be packed.
+    Folder entries keep the folder itself as their first path component.
+    """
+    if os.path.isdir(src_path):
+        for root, _, filenames in os.walk(src_path):
+            for filename in sorted(filenames):
+                file_path = os.path.join(root, filename)
+                yield file_path, os.path.relpath(file_path, os.path.dirname(src_path)).replace(os.sep, '/')
+    elif os.path.isfile(src_path):
+        yield src_path, os.path.basename(src_path)
+
+class PakReader:
+    """
+    Memory-mapped, read-only view of a .PAK shared by extraction, metadata lookups and
+    verification. entry() hands out memoryview slices of the mapping, so a block is never
+    copied before it is inflated or written. The file is opened lazily, reopened after
+    close(), and pickled by path so readers can be sent to process pools. Blocks are
+    inflated with codec (TorcEngine.codec when None).
+    """
+
+    def __init__(self, pak_path, codec=None):
+        self.path = pak_path
+        self.codec = codec
+        self._lock = threading.Lock()
+        self._file = self._map = self._view = None
+        self._stat = None
+
+    def __reduce__(self):
+        return (PakReader, (self.path, self.codec))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self):
+        self._file = open(self.path, "rb")
+        st = os.fstat(self._file.fileno())
+        self._stat = (st.st_size, st.st_mtime_ns)
+        # mmap refuses empty files; a fresh archive simply has nothing to slice
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else None
+        self._view = memoryview(self._map) if self._map is not None else memoryview(b"")
+
+    @property
+    def size(self):
+        with self._lock:
+            if self._view is None: self._open()
+            return self._stat[0]
+
+    def is_current(self):
+        """False once the file on disk no longer matches the mapping (size or mtime changed)."""
+        if self._stat is None: return True
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) == self._stat
+
+    def entry(self, offset, size):
+        """Zero-copy slice of a stored block, clamped at end of file like a short read."""
+        offset, size = int(offset), int(size)
+        with self._lock:
+            if self._view is None: self._open()
+            return self._view[offset:offset + size]
+
+    def header(self, offset):
+        return TorcEngine.parse_zig_header(self.entry(offset, 8))
+
+    def read(self, offset, size):
+        """Decoded payload of one entry (see TorcEngine.decompress_zig)."""
+        return TorcEngine.decompress_zig(self.entry(offset, size), self.codec)
+
+    def stream(self, offset, size, sink, chunk_size=STREAM_CHUNK):
+        """Writes the decoded payload of one entry into sink (see TorcEngine.stream_zig)."""
+        return TorcEngine.stream_zig(self.entry(offset, size), sink, chunk_size, self.codec)
+
+    def copy_to(self, offset, size, dst_file):
+        """
+        Copies stored bytes into an unbuffered dst_file kernel-side (see copy_range), or
+        from the mapping where the OS cannot. Clamped at end of file; returns bytes copied.
+        """
+        with self._lock:
+            if self._view is None: self._open()
+            src_file = self._file
+        done = copy_range(src_file, dst_file, offset, size, fallback=False)
+        rest = self.entry(offset + done, size - done)
+        while len(rest):
+            n = dst_file.write(rest)
+            rest = rest[n:]; done += n
+        return done
+
+    def close(self):
+        with self._lock:
+            if self._view is None: return
+            self._view.release()
+            if self._map is not None:
+                try:
+                    self._map.close()
+                except BufferError:
+                    pass  # entry slices still alive; the mapping is freed with them
+            self._file.close()
+            self._file = self._map = self._view = None
+
+class EntryFile(io.RawIOBase):
+    """
+    Read-only, seekable file over one stored block of a PakReader.
+    RAW payloads are sliced straight out of the mapping. zIG payloads are inflated on
+    demand: every checkpoint_interval bytes of output a copy of the decompressor is kept,
+    so a seek backwards resumes from the nearest checkpoint instead of the start, and the
+    last inflated chunk is cached so small sequential reads do not touch zlib at all.
+    Unknown blocks read as their raw bytes, like TorcEngine.decompress_zig.
+    """
+
+    def __init__(self, reader, offset, size, name=None, chunk_size=STREAM_CHUNK,
+                 checkpoint_interval=CHECKPOINT_INTERVAL):
+        super().__init__()
+        self.name = name
+        self.chunk_size = max(1, min(chunk_size, checkpoint_interval))
+        self.checkpoint_interval = checkpoint_interval
+        self._block = reader.entry(offset, size)
+        info = TorcEngine.parse_zig_header(self._block)
+        self._pos = 0
+        self._payload = None
+        if info and info['sig'] == b"zIG":
+            self._payload = self._block[8:]
+            self.size = info['orig_size']
+            d = self._decompressor()
+            self._marks, self._checkpoints = [0], [(0, 0, d)]
+            self._d, self._in, self._out, self._cache = d.copy(), 0, 0, (0, b"")
+        else:
+            self._data = self._block[8:] if info and info['sig'] == b"RAW" else self._block
+            self.size = len(self._data)
+
+    def _decompressor(self):
+        """
+        Fresh decompressobj for the payload's variant (see deflate_variants). Always stdlib
+        zlib: checkpoints need decompressobj.copy(), which not every backend offers.
+        """
+        for wbits in TorcEngine.deflate_variants(self._payload):
+            try:
+                zlib.decompressobj(wbits).decompress(self._payload[:self.chunk_size], 1)
+                return zlib.decompressobj(wbits)
+            except zlib.error:
+                continue
+        raise zlib.error(f"zIG block of {self.name or 'entry'} does not inflate")
+
+    def _restore(self, pos):
+        """
+        Moves the decompressor to the last checkpoint at or before pos, unless it already
+        sits between that checkpoint and pos.
+        """
+        out, consumed, d = self._checkpoints[bisect.bisect_right(self._marks, pos) - 1]
+        if out <= self._out <= pos: return
+        self._d, self._in, self._out = d.copy(), consumed, out
+        self._cache = (out, b"")
+
+    def _step(self):
+        """Inflates up to chunk_size more bytes into the cache; False at end of stream."""
+        d = self._d
+        if d.eof: return False
+        data = self._payload[self._in:self._in + self.chunk_size]
+        if data:
+            out = d.decompress(data, self.chunk_size)
+            self._in += len(data) - len(d.unconsumed_tail)
+        else:
+            out = d.flush()
+            if not d.eof: raise zlib.error("incomplete or truncated stream")
+        self._cache = (self._out, out)
+        self._out += len(out)
+        if not d.eof and self._out >= self._marks[-1] + self.checkpoint_interval:
+            self._marks.append(self._out)
+            self._checkpoints.append((self._out, self._in, d.copy()))
+        return bool(out) or not d.eof
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        if base + offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = base + offset
+        return self._pos
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        view = memoryview(b).cast('B')
+        n = max(0, min(len(view), self.size - self._pos))
+        if self._payload is None:
+            view[:n] = self._data[self._pos:self._pos + n]
+            self._pos += n
+            return n
+        filled = 0
+        while filled < n:
+            pos = self._pos + filled
+            start, buf = self._cache
+            if start <= pos < start + len(buf):
+                k = min(n - filled, start + len(buf) - pos)
+                view[filled:filled + k] = buf[pos - start:pos - start + k]
+                filled += k
+                continue
+            self._restore(pos)
+            if not self._step():
+                break  # stream shorter than its header claims
+        self._pos += filled
+        return filled
+
+    def close(self):
+        if not self.closed:
+            self._payload = self._data = self._checkpoints = self._cache = None
+            self._block.release()
+        super().close()
+
+def new_result():
+    return {'entries': 0, 'bytes': 0, 'errors': []}
+
+class JobCancelled(Exception):
+    """Raised out of an engine operation whose JobControl was cancelled."""
+
+class JobControl:
+    """
+    Progress counters and a cancel flag shared by a running engine operation
+    and the thread that started it. The engine adds to the counters once per
+    batch or block, so readers can poll them at any rate without a queue.
+    """
+
+    def __init__(self):
+        self.entries = 0
+        self.bytes = 0
+        self.total = 0
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def expect(self, entries):
+        with self._lock:
+            self.total += entries
+
+    def add(self, entries, nbytes):
+        with self._lock:
+            self.entries += entries
+            self.bytes += nbytes
+
+    def snapshot(self):
+        with self._lock:
+            return self.entries, self.bytes, self.total
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+class PhaseStats:
+    """
+    Wall seconds, calls and bytes in/out per phase of an operation (index, mkdir,
+    create, decode, write, read, deflate, append, ...). Collection is per thread:
+    collecting() installs an instance for the calling thread, and run_jobs gives
+    pool workers their own and merges them back, so no locking is needed.
+    Seconds are summed over workers and can exceed the elapsed time.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.elapsed = 0.0
+
+    def add(self, phase, seconds, bytes_in=0, bytes_out=0, count=1):
+        p = self.phases.get(phase)
+        if p is None:
+            p = self.phases[phase] = [0.0, 0, 0, 0]
+        p[0] += seconds; p[1] += count; p[2] += bytes_in; p[3] += bytes_out
+
+    def merge(self, other):
+        for phase, (seconds, count, bytes_in, bytes_out) in other.phases.items():
+            self.add(phase, seconds, bytes_in, bytes_out, count)
+
+    def as_dict(self):
+        phases = {}
+        for phase, (seconds, count, bytes_in, bytes_out) in self.phases.items():
+            moved = bytes_out or bytes_in
+            phases[phase] = {'seconds': round(seconds, 6), 'calls': count,
+                             'bytes_in': bytes_in, 'bytes_out': bytes_out,
+                             'mb_per_s': round(moved / seconds / (1024 * 1024), 2) if seconds else None,
+                             'ratio': round(bytes_out / bytes_in, 4) if bytes_in and bytes_out else None}
+        return {'elapsed': round(self.elapsed, 6), 'phases': phases}
+
+    def summary(self):
+        """Text table of the phases, slowest first."""
+        phases = self.as_dict()['phases']
+        lines = [f"{'phase':<8} {'calls':>9} {'seconds':>9} {'in MB':>10} {'out MB':>10} {'MB/s':>8} {'ratio':>6}"]
+        for phase, p in sorted(phases.items(), key=lambda item: -item[1]['seconds']):
+            rate = f"{p['mb_per_s']:.1f}" if p['mb_per_s'] else "-"
+            ratio = f"{p['ratio']:.3f}" if p['ratio'] else "-"
+            lines.append(f"{phase:<8} {p['calls']:>9,} {p['seconds']:>9.3f} {p['bytes_in'] / 1048576:>10.1f} "
+                         f"{p['bytes_out'] / 1048576:>10.1f} {rate:>8} {ratio:>6}")
+        lines.append(f"elapsed {self.elapsed:.3f}s")
+        return "\n".join(lines)
+
+_local = threading.local()
+
+def current_stats():
+    """PhaseStats collecting for this thread, or None (the default: no timing at all)."""
+    return getattr(_local, 'stats', None)
+
+@contextmanager
+def collecting(stats):
+    """Collects the phases of engine calls made by this thread inside the block into stats."""
+    previous = current_stats()
+    _local.stats = stats
+    started = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.elapsed += time.perf_counter() - started
+        _local.stats = previous
+
+def run_instrumented(func, *args):
+    """Pool body while collecting: runs func(*args) under a fresh PhaseStats and returns (result, stats)."""
+    stats = PhaseStats()
+    with collecting(stats):
+        return func(*args), stats
+
+class TimedSink:
+    """File wrapper that adds the time spent in write() to seconds; everything else passes through."""
+
+    def __init__(self, f):
+        self.file = f
+        self.seconds = 0.0
+
+    def write(self, data):
+        started = time.perf_counter()
+        n = self.file.write(data)
+        self.seconds += time.perf_counter() - started
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+def write_entry(reader, offset, size, output_path, chunk_size=STREAM_CHUNK, make_dirs=True):
+    """
+    Streams one block from a PakReader into output_path. Returns bytes written.
+    RAW payloads are copied kernel-side from the PAK past their 8-byte header
+    (PakReader.copy_to); inflated data goes out through a chunk_size write buffer.
+    make_dirs=False skips os.makedirs when the caller created the folders up front.
+    While collecting, reading and inflating the block count as "decode" (mmap page-ins
+    happen inside zlib) and the file writes and close as "write".
+    """
+    stats = current_stats()
+    raw = size >= 8 and (reader.header(offset) or {}).get('sig') == b"RAW"
+    if stats is None:
+        if make_dirs: os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if raw:
+            with open(output_path, "wb", buffering=0) as out_file:
+                return reader.copy_to(offset + 8, size - 8, out_file)
+        with open(output_path, "wb") as out_file:
+            return reader.stream(offset, size, out_file, chunk_size)
+
+    t0 = time.perf_counter()
+    if make_dirs: os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    t1 = time.perf_counter()
+    if raw:
+        with open(output_path, "wb", buffering=0) as out_file:
+            t2 = time.perf_counter()
+            written = reader.copy_to(offset + 8, size - 8, out_file)
+            t3 = t2
+    else:
+        with open(output_path, "wb") as out_file:
+            t2 = time.perf_counter()
+            sink = TimedSink(out_file)
+            written = reader.stream(offset, size, sink, chunk_size)
+            t3 = time.perf_counter() - sink.seconds
+    t4 = time.perf_counter()
+    if make_dirs: stats.add("mkdir", t1 - t0)
+    stats.add("create", t2 - t1)
+    stats.add("decode", t3 - t2, size, written)
+    stats.add("write", t4 - t3, 0, written)
+    return written
+
+def sync_file(path):
+    """fsync an already written file by path (opened for writing, as Windows requires)."""
+    fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def extract_batch(reader, batch, output_folder, chunk_size=STREAM_CHUNK, sync=False):
+    """
+    Worker body: extracts (name, offset, size, rel_path) tuples through one PakReader
+    into folders plan_extraction already created. Module-level so process pools can
+    pickle it. With sync, the batch's files are fsynced together once all are written
+    rather than one by one. Returns [(name, bytes, error)].
+    """
+    results = []
+    verbose = logging.getLogger().isEnabledFor(logging.DEBUG)
+    for name, offset, size, rel_path in batch:
+        try:
+            written = write_entry(reader, offset, size, os.path.join(output_folder, rel_path), chunk_size, False)
+            if verbose: logging.debug(f"Extracted: {rel_path} ({written:,} bytes)")
+            results.append((name, written, None))
+        except (OSError, ValueError) + DEFLATE_ERRORS as e:
+            logging.error(f"Failed to extract {name} from {reader.path}: {e}")
+            results.append((name, 0, str(e)))
+    if sync:
+        started = time.perf_counter()
+        for i, ((name, written, error), (_, _, _, rel_path)) in enumerate(zip(results, batch)):
+            if error: continue
+            try:
+                sync_file(os.path.join(output_folder, rel_path))
+            except OSError as e:
+                logging.error(f"Failed to sync {rel_path}: {e}")
+                results[i] = (name, written, str(e))
+        stats = current_stats()
+        if stats: stats.add("fsync", time.perf_counter() - started, count=len(results))
+    return results
+
+def check_block(block, chunk_size=STREAM_CHUNK, codec=None):
+    """
+    Problem with a stored block as a message, or None when its signature is known and it
+    decodes to exactly the size its header declares. zIG payloads are inflated chunk by
+    chunk and thrown away, so memory stays at a few chunk_size buffers.
+    Returns (message, decoded_bytes).
+    """
+    info = TorcEngine.parse_zig_header(block)
+    if info is None:
+        return "block shorter than its header", 0
+    if info['sig'] == b"RAW":
+        if len(block) - 8 != info['orig_size']:
+            return f"RAW size mismatch: {len(block) - 8} != {info['orig_size']}", len(block) - 8
+        return None, info['orig_size']
+    if info['sig'] != b"zIG":
+        return f"unknown signature {info['sig']!r}", 0
+    failure = None
+    for wbits in TorcEngine.deflate_variants(block[8:]):
+        try:
+            inflated = sum(map(len, TorcEngine.iter_inflate(block[8:], wbits, chunk_size, codec)))
+        except DEFLATE_ERRORS as e:
+            failure = e
+            continue
+        if inflated != info['orig_size']:
+            return f"zIG size mismatch: {inflated} != {info['orig_size']}", inflated
+        return None, inflated
+    return f"zIG block does not inflate: {failure}", 0
+
+def verify_batch(reader, batch, chunk_size=STREAM_CHUNK):
+    """Worker body: checks (name, offset, size) tuples through one PakReader. Returns [(name, bytes, error)]."""
+    results = []
+    for name, offset, size in batch:
+        try:
+            error, decoded = check_block(reader.entry(offset, size), chunk_size, reader.codec)
+        except (OSError, ValueError) as e:
+            error, decoded = str(e), 0
+        results.append((name, decoded, error))
+    return results
+
+class CompressionPolicy:
+    """
+    Chooses RAW or zIG, and the zlib level, for every file packed. Extension rules are
+    applied first (rules maps '.ext' -> level, 0 = RAW; STORE_EXTENSIONS by default).
+    Files under judge_size are simply deflated at level and kept RAW when that saves
+    less than min_gain. Larger ones are judged before deflating: three sample_size slices
+    (start, middle, end), each deflated on its own so no match spans two of them, saving
+    less than min_gain at fast_level store the file RAW, and when level saves less than
+    level_gain more than fast_level on them, the file is packed at fast_level. A block
+    that still comes out no smaller than RAW is stored RAW (fall_back). Picklable for
+    process pools.
+
+    Decisions are dicts {'compress', 'level', 'reason', 'original', 'saved_seconds',
+    'extra_bytes', 'sample_seconds'}: saved_seconds and extra_bytes project the sample
+    to the whole file (deflate time avoided and stored bytes added compared with level;
+    negative extra means the choice is also smaller), None after an extension rule.
+    For RAW files the time is that of fast_level, so a lower bound.
+    """
+
+    def __init__(self, level=9, min_gain=0.05, level_gain=0.01, fast_level=1, sample_size=16 * 1024,
+                 judge_size=1024 * 1024, rules=None):
+        self.level = level
+        self.min_gain = min_gain
+        self.level_gain = level_gain
+        self.fast_level = fast_level
+        self.sample_size = sample_size
+        self.judge_size = max(judge_size, 3 * sample_size)
+        self.rules = dict.fromkeys(STORE_EXTENSIONS, 0) if rules is None else dict(rules)
+
+    def _rule(self, file_path, size):
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in self.rules: return None
+        level = self.rules[ext]
+        return {'compress': level > 0, 'level': level or self.level, 'reason': f"rule {ext}", 'original': size,
+                'saved_seconds': None, 'extra_bytes': None, 'sample_seconds': 0.0}
+
+    def _judge(self, size, parts, codec=None):
+        """Decision for a file of size bytes from sample slices of it."""
+        codec = codec or TorcEngine.codec
+        started = time.perf_counter()
+        decision = {'compress': True, 'level': self.level, 'original': size, 'saved_seconds': 0.0, 'extra_bytes': 0}
+        sampled = sum(map(len, parts))
+        scale = size / sampled
+        deflated = lambda level: sum(len(codec.compress(part, level)) for part in parts)
+        fast = deflated(self.fast_level)
+        t1 = time.perf_counter()
+        gain = 1 - fast / sampled
+        if gain < self.min_gain:
+            decision.update(compress=False, reason=f"sample saves {gain:.1%}",
+                            saved_seconds=(t1 - started) * scale, extra_bytes=int((sampled - fast) * scale))
+        elif self.fast_level != self.level:
+            full = deflated(self.level)
+            t2 = time.perf_counter()
+            extra = (fast - full) / sampled
+            if extra < self.level_gain:
+                decision.update(level=self.fast_level, reason=f"level {self.level} saves {extra:.1%} more",
+                                saved_seconds=max(0.0, (t2 - t1) - (t1 - started)) * scale,
+                                extra_bytes=int((fast - full) * scale))
+            else:
+                decision['reason'] = f"sample saves {1 - full / sampled:.1%}"
+        else:
+            decision['reason'] = f"sample saves {gain:.1%}"
+        decision['sample_seconds'] = time.perf_counter() - started
+        return decision
+
+    @staticmethod
+    def fall_back(decision, block_size, original):
+        """
+        Switches a compress decision to RAW when the block it produced (block_size bytes,
+        header included) is no smaller than the RAW block of original bytes would be.
+        Returns True when the block has to be stored again RAW.
+        """
+        raw_size = original + 8
+        if not decision['compress'] or block_size < raw_size: return False
+        decision.update(compress=False, reason=f"{decision['reason']}, deflated block not smaller than RAW")
+        if decision['extra_bytes'] is not None: decision['extra_bytes'] += raw_size - block_size
+        return True
+
+    def choose(self, file_path, codec=None):
+        """Decision for a file that will be streamed, sampled from disk and deflated with codec."""
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            decision = self._rule(file_path, size)
+            if decision: return decision
+            if size <= 3 * self.sample_size:
+                parts = [f.read()]
+            else:
+                parts = []
+                for pos in (0, (size - self.sample_size) // 2, size - self.sample_size):
+                    f.seek(pos)
+                    parts.append(f.read(self.sample_size))
+        if not any(parts):
+            return {'compress': False, 'level': self.level, 'reason': "empty", 'original': 0,
+                    'saved_seconds': 0.0, 'extra_bytes': 0, 'sample_seconds': 0.0}
+        return self._judge(size, parts, codec)
+
+    def pack(self, file_path, data, codec=None):
+        """(block, decision) for a file already read whole, deflated with codec."""
+        decision = self._rule(file_path, len(data))
+        n = self.sample_size
+        if decision is None and len(data) >= self.judge_size:
+            mid = (len(data) - n) // 2
+            decision = self._judge(len(data), [data[:n], data[mid:mid + n], data[-n:]], codec)
+        if decision is not None:
+            block = TorcEngine.create_zig_header(data, decision['compress'], decision['level'], codec)
+            if self.fall_back(decision, len(block), len(data)):
+                block = TorcEngine.create_zig_header(data, False)
+            return block, decision
+        block = TorcEngine.create_zig_header(data, True, self.level, codec)
+        gain = 1 - (len(block) - 8) / len(data) if data else 0.0
+        decision = {'compress': True, 'level': self.level, 'reason': f"saves {gain:.1%}", 'original': len(data),
+                    'saved_seconds': 0.0, 'extra_bytes': 0, 'sample_seconds': 0.0}
+        if gain < self.min_gain:
+            decision.update(compress=False, extra_bytes=len(data) + 8 - len(block))
+            block = TorcEngine.create_zig_header(data, False)
+        return block, decision
+
+def policy_summary(added):
+    """Totals of the CompressionPolicy decisions recorded on pack_files results ('policy')."""
+    decisions = [f['policy'] for f in added if 'policy' in f]
+    raw = [d for d in decisions if not d['compress']]
+    return {'files': len(decisions),
+            'raw': len(raw),
+            'raw_bytes': sum(d['original'] for d in raw),
+            'by_rule': sum(1 for d in decisions if d['reason'].startswith("rule")),
+            'fast_level': sum(1 for d in decisions if d['compress'] and d['reason'].startswith("level")),
+            'saved_seconds': sum(d['saved_seconds'] or 0.0 for d in decisions),
+            'extra_bytes': sum(d['extra_bytes'] or 0 for d in decisions),
+            'sample_seconds': sum(d['sample_seconds'] for d in decisions)}
+
+def pack_block(file_path, compress=True, level=9, codec=None):
+    """
+    Worker body: reads one file and encapsulates it as a zIG/RAW block deflated with codec.
+    compress may be a CompressionPolicy, which picks RAW/level; (block, decision) is then returned.
+    """
+    stats = current_stats()
+    started = time.perf_counter()
+    with open(file_path, "rb") as f:
+        data = f.read()
+    policy = compress if isinstance(compress, CompressionPolicy) else None
+    if stats is None:
+        return policy.pack(file_path, data, codec) if policy else TorcEngine.create_zig_header(data, compress, level, codec)
+    read = time.perf_counter()
+    if policy:
+        block, decision = packed = policy.pack(file_path, data, codec)
+        compress = decision['compress']
+    else:
+        block = packed = TorcEngine.create_zig_header(data, compress, level, codec)
+    stats.add("read", read - started, 0, len(data))
+    stats.add("deflate" if compress else "store", time.perf_counter() - read, len(data), len(block))
+    return packed
+
+def stream_block(file_path, dst_file, compress=True, level=9, chunk_size=STREAM_CHUNK, codec=None):
+    """
+    Writes one file as a zIG/RAW block at dst_file's position without holding it in memory:
+    the header takes the original size from stat, then the file is fed through a
+    compressobj a chunk at a time. compressobj(level) produces the same bytes as
+    compress(data, level) for a given codec, so streamed and buffered blocks are identical. If the file
+    changed size while being read, the header is rewritten (dst_file must be seekable and
+    not in append mode). Returns (stored_size, header).
+    """
+    stats = current_stats()
+    read_s = deflate_s = write_s = 0.0
+    with open(file_path, "rb") as src:
+        expected = os.fstat(src.fileno()).st_size
+        key = random.randint(1, 254)
+        header = TorcEngine.zig_header(expected, compress, key)
+        start = dst_file.tell()
+        dst_file.write(header)
+        packer = (codec or TorcEngine.codec).compressobj(level) if compress else None
+        total = stored = 0
+        while True:
+            t0 = time.perf_counter()
+            chunk = src.read(chunk_size)
+            t1 = time.perf_counter()
+            if chunk:
+                total += len(chunk)
+                out = packer.compress(chunk) if packer else chunk
+            else:
+                out = packer.flush() if packer else b""
+            t2 = time.perf_counter()
+            if out:
+                dst_file.write(out)
+                stored += len(out)
+            t3 = time.perf_counter()
+            read_s += t1 - t0; deflate_s += t2 - t1; write_s += t3 - t2
+            if not chunk:
+                break
+    if total != expected:
+        logging.warning(f"{file_path} changed size while packing ({expected:,} -> {total:,} bytes)")
+        header = TorcEngine.zig_header(total, compress, key)
+        end = dst_file.tell()
+        dst_file.seek(start)
+        dst_file.write(header)
+        dst_file.seek(end)
+    if stats is not None:
+        stats.add("read", read_s, 0, total)
+        stats.add("deflate" if compress else "store", deflate_s, total, stored + len(header))
+        stats.add("append", write_s, stored, stored)
+    return stored + len(header), bytes(header)
+
+def file_digest(file_path, chunk_size=STREAM_CHUNK):
+    """Content hash of a file on disk, read in chunks."""
+    started = time.perf_counter()
+    h = hashlib.blake2b(digest_size=20)
+    size = 0
+    with open(file_path, "rb") as f:
+        for buf in iter(lambda: f.read(chunk_size), b""):
+            h.update(buf); size += len(buf)
+    stats = current_stats()
+    if stats: stats.add("hash", time.perf_counter() - started, size)
+    return h.digest()
+
+def block_digest(reader, offset, size, chunk_size=STREAM_CHUNK):
+    """
+    Content hash of a stored block's decoded payload; comparable with file_digest.
+    None for a block that does not decode (truncated or corrupt), so it is never shared.
+    """
+    started = time.perf_counter()
+    h = hashlib.blake2b(digest_size=20)
+    try:
+        written = reader.stream(offset, size, h.update, chunk_size)
+    except DEFLATE_ERRORS as e:
+        logging.warning(f"Not deduplicating against {reader.path}+0x{offset:X}: {e}")
+        return None
+    stats = current_stats()
+    if stats: stats.add("hash", time.perf_counter() - started, size, written)
+    return h.digest()
+
+def copy_range(src_file, dst_file, offset, count, fallback=True):
+    """
+    Appends count bytes at offset of src_file to dst_file (both unbuffered), using
+    copy_file_range or sendfile so the data never enters Python where the OS allows it.
+    Returns the number of bytes copied, short only at end of the source. With
+    fallback=False the read/write loop is skipped and the count so far returned instead.
+    """
+    src_fd, dst_fd = src_file.fileno(), dst_file.fileno()
+    done = 0
+    for kernel_copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+        if kernel_copy is None: continue
+        try:
+            while done < count:
+                if kernel_copy is os.sendfile:
+                    n = os.sendfile(dst_fd, src_fd, offset + done, count - done)
+                else:
+                    n = os.copy_file_range(src_fd, dst_fd, count - done, offset + done)
+                if n == 0: return done
+                done += n
+            return done
+        except OSError:
+            continue  # unsupported for this pair of files; try the next method
+    if not fallback: return done
+    src_file.seek(offset + done)
+    while done < count:
+        buf = src_file.read(min(STREAM_CHUNK, count - done))
+        if not buf: break
+        dst_file.write(buf)
+        done += len(buf)
+    return done
+
+def copy_loose(src_path, dst_path):
+    try:
+        started = time.perf_counter()
+        shutil.copy2(src_path, dst_path)
+        size = os.path.getsize(dst_path)
+        stats = current_stats()
+        if stats: stats.add("copy", time.perf_counter() - started, size, size)
+        return [(src_path, size, None)]
+    except OSError as e:
+        logging.error(f"Failed to copy {src_path}: {e}")
+        return [(src_path, 0, str(e))]
+
+class ArchiveEngine:
+    """
+    Headless implementation of every archive operation.
+    Nothing here touches Tk; interactive decisions are made by the caller.
+
+    workers > 1 extracts through a thread pool (zlib releases the GIL),
+    or a process pool when processes=True; None uses every core.
+    Entries are streamed in chunk_size pieces, so each worker holds a few
+    chunk_size buffers plus the 32 KiB deflate window regardless of entry size.
+
+    While job holds a JobControl, extraction, packing and mirroring report
+    progress to it and raise JobCancelled between batches once it is cancelled.
+
+    fsync=True makes extraction durable: each batch fsyncs its files after writing them all.
+    codec names the deflate backend this engine packs and unpacks with (see get_codec);
+    None takes the process default, TorcEngine.codec. Other engines are not affected.
+    """
+
+    def __init__(self, workers=1, processes=False, chunk_size=STREAM_CHUNK, cache_dir=None, level=9, fsync=False,
+                 codec=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.level = level
+        self.fsync = fsync
+        self.codec = TorcEngine.codec if codec is None else get_codec(codec)
+        self.job = None
+        self.indexes = IndexCache(cache_dir=cache_dir)
+        self._content = {}
+        self._scans = {}
+        self._readers = OrderedDict()
+        self._readers_lock = threading.Lock()
+
+    def reader(self, pak_path):
+        """Shared PakReader for an archive; reopened when the file changed on disk."""
+        key = os.path.abspath(pak_path)
+        with self._readers_lock:
+            reader = self._readers.pop(key, None)
+            if reader is not None and not reader.is_current():
+                reader.close()
+            if reader is None:
+                reader = PakReader(pak_path, self.codec)
+            self._readers[key] = reader
+            while len(self._readers) > MAX_OPEN_READERS:
+                self._readers.popitem(last=False)[1].close()
+        return reader
+
+    def release_reader(self, pak_path):
+        """Drops the mapping of an archive before it is rewritten."""
+        with self._readers_lock:
+            reader = self._readers.pop(os.path.abspath(pak_path), None)
+        if reader is not None:
+            reader.close()
+
+    def close(self):
+        with self._readers_lock:
+            readers = list(self._readers.values())
+            self._readers.clear()
+        for reader in readers:
+            reader.close()
+
+    def entry_info(self, pak_path, offset, size):
+        """Block header of one entry: {'sig', 'orig_size', 'key'} or None."""
+        try:
+            return self.reader(pak_path).header(offset)
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to read zIG metadata at {pak_path}+0x{int(offset):X}: {e}")
+            return None
+
+    def index(self, pak_path):
+        """Parsed index of an archive, served from the cache while the .DIR is unchanged."""
+        return self.indexes.get(dir_path_for(pak_path))
+
+    def cached_index(self, pak_path):
+        """Parsed index of an archive if it is already in memory and current, else None."""
+        return self.indexes.peek(dir_path_for(pak_path))
+
+    def write_index(self, pak_path, files):
+        dir_path = dir_path_for(pak_path)
+        started = time.perf_counter()
+        data = TorcEngine.serialize_trie_index(files)
+        with open(dir_path, "wb") as dir_file:
+            dir_file.write(data)
+        self.indexes.invalidate(dir_path)
+        stats = current_stats()
+        if stats: stats.add("save", time.perf_counter() - started, 0, len(data))
+
+    def list_entries(self, pak_path):
+        return self.index(pak_path).entries()
+
+    def new_archive(self, pak_path):
+        if not pak_path.lower().endswith(".pak"):
+            pak_path += ".pak"
+        self.release_reader(pak_path)
+        self._drop_content(os.path.abspath(pak_path))
+        with open(pak_path, "wb"):
+            pass
+        with open(dir_path_for(pak_path), "wb"):
+            pass
+        self.indexes.invalidate(dir_path_for(pak_path))
+        logging.info(f"Created new archive: {pak_path}")
+        return pak_path
+
+    def stream_entry(self, pak_path, offset, size, sink):
+        """Writes the decoded payload of one entry into a caller-supplied file or callable."""
+        return self.reader(pak_path).stream(offset, size, sink, self.chunk_size)
+
+    def open_entry(self, pak_path, name, checkpoint_interval=CHECKPOINT_INTERVAL):
+        """
+        Seekable read-only file (EntryFile) over one entry, e.g. to read a texture header
+        without inflating the whole asset. Wrap in io.BufferedReader for line/struct parsing.
+        """
+        f = self.index(pak_path).lookup(name)
+        if f is None:
+            raise FileNotFoundError(f"{name} is not in {pak_path}")
+        return EntryFile(self.reader(pak_path), f['offset'], f['size'], name,
+                         self.chunk_size, checkpoint_interval)
+
+    def union_index(self, root, priority=()):
+        """
+        UnionIndex of every archive under root, refreshed against the disk. With an index
+        cache_dir it is saved there between runs, so only changed .DIRs are parsed again.
+        """
+        path = None
+        if self.indexes.cache_dir:
+            digest = hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()
+            path = os.path.join(self.indexes.cache_dir, f"union-{digest}.idx")
+        union = UnionIndex(root, priority, path)
+        union.load()
+        counts = union.refresh(self.index)
+        if counts['unchanged'] != len(union.archives) or counts['removed']:
+            union.save()
+        logging.info(f"Union index of {root}: {len(union):,} names in {len(union.archives)} archives ({counts})")
+        return union
+
+    def search(self, pak_paths, pattern, regex=False, ignore_case=False, limit=None):
+        """
+        Entries of every archive in pak_paths matching a glob or regex (see TrieIndex.search),
+        each tagged with its 'archive'; shadowed copies are kept. Stops after limit hits.
+        """
+        hits = []
+        for pak_path in pak_paths:
+            left = None if limit is None else limit - len(hits)
+            if left is not None and left <= 0: break
+            found = self.index(pak_path).search(pattern, regex, ignore_case, left)
+            for f in found:
+                f['archive'] = pak_path
+            hits.extend(found)
+            self.progress(len(found), 0)
+        return hits
+
+    def extract_vfile(self, pak_path, offset, size, name, output_dir, flatten=False):
+        safe_name = safe_entry_path(name, flatten)
+        written = write_entry(self.reader(pak_path), offset, size, os.path.join(output_dir, safe_name), self.chunk_size)
+        logging.debug(f"Extracted: {safe_name} ({written:,} bytes)")
+        return written
+
+    def plan_extraction(self, pak_path, output_folder, flatten=False, files=None):
+        """
+        Splits an archive into extraction jobs of offset-sorted entries for sequential reads.
+        When several entries map to the same output path, the last one in index order wins,
+        exactly as serial extraction would leave it. Every output folder is created here,
+        once, so the workers only open and write files.
+        """
+        if files is None:
+            files = self.list_entries(pak_path)
+        targets = {}
+        for f in files:
+            targets[safe_entry_path(f['name'], flatten)] = f
+        ordered = sorted(targets.items(), key=lambda t: (t[1]['offset'], t[0]))
+        self.make_folders(os.path.dirname(os.path.join(output_folder, rel_path)) for rel_path in targets)
+
+        reader = self.reader(pak_path)
+        jobs, batch, batch_bytes = [], [], 0
+        for rel_path, f in ordered:
+            batch.append((f['name'], f['offset'], f['size'], rel_path))
+            batch_bytes += f['size']
+            if len(batch) >= BATCH_ENTRIES or batch_bytes >= BATCH_BYTES:
+                jobs.append((extract_batch, reader, batch, output_folder, self.chunk_size, self.fsync))
+                batch, batch_bytes = [], 0
+        if batch:
+            jobs.append((extract_batch, reader, batch, output_folder, self.chunk_size, self.fsync))
+        return jobs
+
+    @staticmethod
+    def make_folders(folders):
+        """
+        Creates a set of folders with one makedirs per leaf (parents come with it).
+        Failures are left to the entries below, which report them when they open.
+        """
+        started = time.perf_counter()
+        ordered = sorted(set(folders))
+        leaves = [d for d, nxt in zip(ordered, ordered[1:] + [""]) if not nxt.startswith(d + os.sep)]
+        for folder in leaves:
+            try:
+                os.makedirs(folder, exist_ok=True)
+            except OSError:
+                pass
+        stats = current_stats()
+        if stats: stats.add("mkdir", time.perf_counter() - started, count=len(leaves))
+
+    def pool(self):
+        if self.processes:
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def iter_packed(self, new_files, compress=True):
+        """
+        Yields the packed block of every (file_path, rel_name) in input order, or None
+        for files of STREAM_PACK_SIZE or more, which the caller streams with stream_block.
+        Under a CompressionPolicy, blocks come as (block, decision) (see pack_block).
+        With workers > 1, up to 2 * workers files are read and compressed ahead
+        of the consumer, which bounds memory to that many blocks.
+        """
+        def streamed(file_path):
+            try:
+                return os.path.getsize(file_path) >= STREAM_PACK_SIZE
+            except OSError:
+                return False  # let pack_block raise the real error
+
+        if self.workers <= 1 or len(new_files) <= 1:
+            for file_path, _ in new_files:
+                yield None if streamed(file_path) else pack_block(file_path, compress, self.level, self.codec)
+            return
+        with self.pool() as pool:
+            pending = deque()
+            try:
+                for file_path, _ in new_files:
+                    if streamed(file_path):
+                        pending.append(None)
+                    else:
+                        pending.append(self.submit(pool, pack_block, file_path, compress, self.level, self.codec))
+                    if len(pending) >= 2 * self.workers:
+                        fut = pending.popleft()
+                        yield None if fut is None else self.collect(fut.result())
+                while pending:
+                    fut = pending.popleft()
+                    yield None if fut is None else self.collect(fut.result())
+            finally:
+                for fut in pending:
+                    if fut is not None: fut.cancel()
+
+    def map(self, func, *iterables):
+        """map() over the worker pool, preserving order."""
+        if self.workers <= 1:
+            return list(map(func, *iterables))
+        with self.pool() as pool:
+            futures = [self.submit(pool, func, *args) for args in zip(*iterables)]
+            return [self.collect(fut.result()) for fut in futures]
+
+    @staticmethod
+    def submit(pool, func, *args):
+        """pool.submit that, while this thread is collecting stats, has the worker collect too."""
+        if current_stats() is None:
+            return pool.submit(func, *args)
+        return pool.submit(run_instrumented, func, *args)
+
+    @staticmethod
+    def collect(value):
+        """Result of a submit()ted job, merging the worker's stats into this thread's."""
+        stats = current_stats()
+        if stats is None:
+            return value
+        value, worker_stats = value
+        stats.merge(worker_stats)
+        return value
+
+    def _content_path(self, pak_path):
+        cache_dir = self.indexes.cache_dir
+        if not cache_dir: return None
+        return os.path.join(cache_dir, hashlib.sha1(pak_path.encode('utf-8')).hexdigest() + ".hashes")
+
+    def _store_content(self, pak_path, blocks):
+        """Remembers block hashes for the PAK as it is on disk now (size and mtime)."""
+        stat = IndexCache._key(pak_path)
+        self._content[pak_path] = (stat, blocks)
+        disk_path = self._content_path(pak_path)
+        if disk_path is None: return
+        try:
+            with open(disk_path + ".tmp", "wb") as f:
+                pickle.dump((pak_path, stat, blocks), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(disk_path + ".tmp", disk_path)
+        except OSError as e:
+            logging.warning(f"Failed to write content hashes for {pak_path}: {e}")
+
+    def _drop_content(self, pak_path):
+        """Forgets block hashes of an archive whose blocks moved or vanished."""
+        self._content.pop(pak_path, None)
+        disk_path = self._content_path(pak_path)
+        if disk_path and os.path.exists(disk_path):
+            os.remove(disk_path)
+
+    def _load_content(self, pak_path):
+        """
+        Remembered block hashes, or {} when the PAK changed on disk since they were stored:
+        a rewrite outside the engine can put different content behind an unchanged header.
+        """
+        stat = IndexCache._key(pak_path)
+        if pak_path in self._content:
+            stored_stat, blocks = self._content[pak_path]
+            return blocks if stored_stat == stat else {}
+        disk_path = self._content_path(pak_path)
+        if disk_path is None: return {}
+        try:
+            with open(disk_path, "rb") as f:
+                stored_path, stored_stat, blocks = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, ValueError, TypeError):
+            return {}
+        return blocks if (stored_path, stored_stat) == (pak_path, stat) else {}
+
+    def content_hashes(self, pak_path, sizes=None):
+        """
+        {digest: (offset, size)} over the decoded payload of every live block of an archive.
+        Digests are remembered per block next to its 8-byte header (in memory, and in the
+        cache dir when one is set) for the PAK's current size and mtime; they are all dropped
+        once the PAK changes outside the engine, and a block is rehashed when its header changed.
+        With sizes, blocks not hashed yet are only hashed when the original size in their
+        header is one of them, so packing a few files does not inflate the whole archive.
+        Blocks that do not decode are left out.
+        """
+        key = os.path.abspath(pak_path)
+        known = self._load_content(key)
+        reader = self.reader(pak_path)
+        blocks, todo = {}, []
+        for offset, size in sorted({(o, s) for _, o, s in self.index(pak_path)}):
+            header = bytes(reader.entry(offset, 8))
+            hit = known.get((offset, size))
+            if hit and hit[0] == header:
+                blocks[(offset, size)] = hit
+            elif sizes is None or self._decoded_size(header, size) in sizes:
+                todo.append((offset, size, header))
+        if todo:
+            digests = self.map(block_digest, [reader] * len(todo), [t[0] for t in todo],
+                               [t[1] for t in todo], [self.chunk_size] * len(todo))
+            for (offset, size, header), digest in zip(todo, digests):
+                blocks[(offset, size)] = (header, digest)
+            logging.info(f"Hashed {len(todo)} blocks of {os.path.basename(pak_path)}")
+        self._store_content(key, blocks)
+
+        by_digest = {}
+        for block, (_, digest) in sorted(blocks.items()):
+            if digest is not None: by_digest.setdefault(digest, block)
+        return by_digest
+
+    @staticmethod
+    def _decoded_size(header, size):
+        """Payload size a block decodes to, from its header; unknown blocks decode as themselves."""
+        info = TorcEngine.parse_zig_header(header)
+        if info is None or info['sig'] not in (b"zIG", b"RAW"): return size
+        return info['orig_size']
+
+    def progress(self, entries, nbytes):
+        """Adds to the current job's counters and stops here if it was cancelled."""
+        job = self.job
+        if job is not None:
+            job.add(entries, nbytes)
+            job.check()
+
+    def _wait(self, fut):
+        job = self.job
+        if job is None:
+            return fut.result()
+        while True:
+            try:
+                return fut.result(timeout=0.1)
+            except FutureTimeout:
+                job.check()
+
+    def _outcome(self, job, entries):
+        self.progress(len(entries), sum(written for _, written, _ in entries))
+        return job, entries
+
+    def run_jobs(self, jobs):
+        """
+        Runs (func, *args) jobs serially or on the worker pool.
+        Results are merged in submission order, so reports are deterministic.
+        On cancellation, queued jobs are dropped and running ones finish first.
+        """
+        result = new_result()
+        if self.job is not None:
+            self.job.expect(sum(len(job[2]) if job[0] in (extract_batch, verify_batch) else 1 for job in jobs))
+        if self.workers > 1 and len(jobs) > 1:
+            with self.pool() as pool:
+                futures = [self.submit(pool, *job) for job in jobs]
+                try:
+                    outcomes = [self._outcome(job, self.collect(self._wait(fut))) for job, fut in zip(jobs, futures)]
+                finally:
+                    for fut in futures:
+                        fut.cancel()
+        else:
+            outcomes = [self._outcome(job, job[0](*job[1:])) for job in jobs]
+        for job, entries in outcomes:
+            for name, written, error in entries:
+                result['entries'] += 1
+                result['bytes'] += written
+                if error:
+                    archive = job[1].path if isinstance(job[1], PakReader) else job[1]
+                    result['errors'].append({'archive': archive, 'name': name, 'error': error})
+        return result
+
+    def unpack_pak(self, pak_path, output_folder, flatten=False, files=None):
+        """Extracts every entry (or the given files) of an archive. Returns {'entries', 'bytes', 'errors'}."""
+        return self.run_jobs(self.plan_extraction(pak_path, output_folder, flatten, files))
+
+    def pack_files(self, pak_path, new_files, compress=True, dedup=False):
+        """
+        Appends (file_path, rel_name) pairs to an archive with 4-byte alignment.
+        Names already in the index are overwritten; their old blocks stay orphaned in the PAK.
+        Blocks are compressed on the worker pool (see iter_packed) and written by this
+        thread in input order, so the resulting archive does not depend on scheduling.
+        Files of STREAM_PACK_SIZE or more are compressed by this thread straight into the
+        PAK a chunk at a time (stream_block), so memory does not grow with file size.
+
+        With dedup, files are hashed first; a file whose content matches a live block of the
+        archive or an earlier file of this batch is pointed at that block and never compressed.
+        Such entries are returned with 'shared': True.
+
+        compress may be a CompressionPolicy, which packs each file RAW or at the level it picks;
+        its decision is returned as the entry's 'policy' (see policy_summary).
+
+        Cancelling the job leaves the index untouched; blocks already appended stay orphaned.
+        """
+        known, digests, shared = {}, [], {}
+        if dedup:
+            known = self.content_hashes(pak_path, {os.path.getsize(fp) for fp, _ in new_files})
+            digests = self.map(file_digest, [fp for fp, _ in new_files])
+            first = {}
+            for i, ((_, rel_name), digest) in enumerate(zip(new_files, digests)):
+                if digest in known or digest in first:
+                    shared[i] = digest
+                else:
+                    first[digest] = i
+        to_pack = [nf for i, nf in enumerate(new_files) if i not in shared]
+        policy = compress if isinstance(compress, CompressionPolicy) else None
+        if self.job is not None:
+            self.job.expect(len(to_pack))
+
+        self.release_reader(pak_path)
+        replaced = {rel_name for _, rel_name in new_files}
+        existing_files = [f for f in self.list_entries(pak_path) if f['name'] not in replaced]
+        added = []
+        new_blocks = {}
+
+        stats = current_stats()
+        verbose = logging.getLogger().isEnabledFor(logging.DEBUG)
+        # hashes of the blocks already in the PAK, carried over the append below
+        content_key = os.path.abspath(pak_path)
+        hashed = self._load_content(content_key)
+        # r+b rather than ab: stream_block may seek back to fix up a header
+        with open(pak_path, "r+b" if os.path.exists(pak_path) else "w+b") as pak_file:
+            pak_file.seek(0, os.SEEK_END)
+            for (file_path, rel_name), packed in zip(to_pack, self.iter_packed(to_pack, compress)):
+                started = time.perf_counter()
+                current_pos = pak_file.tell()
+                padding = (4 - (current_pos % 4)) % 4
+                if padding:
+                    pak_file.write(b"\x00" * padding)
+
+                offset = pak_file.tell()
+                decision = None
+                if policy:
+                    packed, decision = packed or (None, policy.choose(file_path, self.codec))
+                if packed is None:
+                    packs, level = (decision['compress'], decision['level']) if decision else (compress, self.level)
+                    size, header = stream_block(file_path, pak_file, packs, level, self.chunk_size, self.codec)
+                    if decision and policy.fall_back(decision, size, TorcEngine.parse_zig_header(header)['orig_size']):
+                        pak_file.seek(offset)
+                        pak_file.truncate()
+                        size, header = stream_block(file_path, pak_file, False, level, self.chunk_size, self.codec)
+                else:
+                    pak_file.write(packed)
+                    size, header = len(packed), bytes(packed[:8])
+                    if stats: stats.add("append", time.perf_counter() - started, size, size + padding)
+
+                added.append({'name': rel_name, 'offset': offset, 'size': size})
+                if decision: added[-1]['policy'] = decision
+                new_blocks[(offset, size)] = header
+                if verbose: logging.debug(f"Packed: {rel_name} at 0x{offset:X} (padded: {padding} bytes)")
+                self.progress(1, size)
+
+        if dedup:
+            blocks = dict(hashed)
+            fresh = iter(list(added))
+            for i, (file_path, rel_name) in enumerate(new_files):
+                if i in shared:
+                    offset, size = known[shared[i]]
+                    added.append({'name': rel_name, 'offset': offset, 'size': size, 'shared': True})
+                    if verbose: logging.debug(f"Deduplicated: {rel_name} -> 0x{offset:X}")
+                else:
+                    f = next(fresh)
+                    known[digests[i]] = (f['offset'], f['size'])
+                    blocks[(f['offset'], f['size'])] = (new_blocks[(f['offset'], f['size'])], digests[i])
+            self._store_content(content_key, blocks)
+        elif hashed:
+            self._store_content(content_key, hashed)
+
+        self.write_index(pak_path, existing_files + added)
+        return added
+
+    def delete_entries(self, pak_path, targets):
+        """
+        Removes (path, kind) targets from the index, kind being "vfile" or "vdir".
+        Only the .DIR is rewritten; the PAK keeps its size. Returns the removed count.
+        """
+        files = self.list_entries(pak_path)
+
+        new_files = []
+        removed_count = 0
+        for f in files:
+            keep = True
+            for target_path, target_type in targets:
+                if target_type == "vfile" and f['name'] == target_path:
+                    keep = False
+                    break
+                if target_type == "vdir" and f['name'].startswith(target_path + "/"):
+                    keep = False
+                    break
+            if keep:
+                new_files.append(f)
+            else:
+                removed_count += 1
+
+        self.write_index(pak_path, new_files)
+
+        logging.info(f"Removed {removed_count} entries from {os.path.basename(pak_path)}")
+        return removed_count
+
+    def compact_archive(self, pak_path):
+        """
+        Rewrites an archive with only the blocks its index still references, copied verbatim
+        (no recompression) in offset order with 4-byte alignment. Names sharing a block keep
+        sharing it. The new PAK and DIR are written next to the originals as .tmp, the old PAK
+        is moved to .bak, then both are swapped in with os.replace; if either swap raises, the
+        .bak is put back. The .bak is removed once both are in place. A process that dies
+        mid-swap leaves these files behind, and the next compaction starts by sorting them
+        out (see _recover_compaction). Reports progress per block copied; cancelling removes
+        the temporaries and leaves the archive as it was. Returns {'archive', 'entries',
+        'blocks', 'old_size', 'new_size', 'reclaimed'}.
+        """
+        self._recover_compaction(pak_path)
+        files = self.list_entries(pak_path)
+        old_size = os.path.getsize(pak_path)
+        bad = [f['name'] for f in files if f['offset'] + f['size'] > old_size]
+        if bad:
+            raise ValueError(f"{len(bad)} entries of {pak_path} point past the end of the PAK "
+                             f"(first: {bad[0]}); run verify before compacting")
+
+        blocks = sorted({(f['offset'], f['size']) for f in files})
+        if self.job: self.job.expect(len(blocks))
+        moved = {}
+        tmp_pak, tmp_dir = pak_path + ".tmp", dir_path_for(pak_path) + ".tmp"
+        try:
+            with open(pak_path, "rb", buffering=0) as src, open(tmp_pak, "wb", buffering=0) as dst:
+                pos = 0
+                for offset, size in blocks:
+                    padding = (4 - (pos % 4)) % 4
+                    if padding:
+                        dst.write(b"\x00" * padding); pos += padding
+                    if copy_range(src, dst, offset, size) != size:
+                        raise OSError(f"short read at 0x{offset:X} in {pak_path}")
+                    moved[(offset, size)] = pos
+                    pos += size
+                    self.progress(1, size)
+            new_files = [{'name': f['name'], 'offset': moved[(f['offset'], f['size'])], 'size': f['size']}
+                         for f in files]
+            with open(tmp_dir, "wb") as dir_file:
+                dir_file.write(TorcEngine.serialize_trie_index(new_files))
+        except BaseException:
+            for tmp in (tmp_pak, tmp_dir):
+                if os.path.exists(tmp): os.remove(tmp)
+            raise
+
+        self.release_reader(pak_path)
+        self._drop_content(os.path.abspath(pak_path))
+        bak_pak = pak_path + ".bak"
+        os.replace(pak_path, bak_pak)
+        try:
+            os.replace(tmp_pak, pak_path)
+            os.replace(tmp_dir, dir_path_for(pak_path))
+        except BaseException:
+            os.replace(bak_pak, pak_path)
+            for tmp in (tmp_pak, tmp_dir):
+                if os.path.exists(tmp): os.remove(tmp)
+            raise
+        self.indexes.invalidate(dir_path_for(pak_path))
+        os.remove(bak_pak)
+
+        new_size = os.path.getsize(pak_path)
+        logging.info(f"Compacted {os.path.basename(pak_path)}: {old_size:,} -> {new_size:,} bytes")
+        return {'archive': pak_path, 'entries': len(files), 'blocks': len(blocks),
+                'old_size': old_size, 'new_size': new_size, 'reclaimed': old_size - new_size}
+
+    def _recover_compaction(self, pak_path):
+        """
+        Cleans up after a compaction that died before finishing. With <pak>.bak and the new
+        DIR still at <dir>.tmp, the DIR was never swapped: the old PAK goes back in place so
+        it matches the old DIR again. Temporaries without a .bak come from a run that died
+        before swapping and are removed. Any other leftover .bak is refused rather than
+        guessed at (it is the only copy of the old PAK, or a backup of the user's own).
+        """
+        bak_pak = pak_path + ".bak"
+        tmp_pak, tmp_dir = pak_path + ".tmp", dir_path_for(pak_path) + ".tmp"
+        if os.path.exists(bak_pak):
+            if not os.path.exists(tmp_dir):
+                raise ValueError(f"{bak_pak} is left from an earlier compaction; check the archive "
+                                 f"and remove or restore it before compacting again")
+            logging.warning(f"Rolling back interrupted compaction of {pak_path}")
+            self.release_reader(pak_path)
+            self._drop_content(os.path.abspath(pak_path))
+            os.replace(bak_pak, pak_path)
+            self.indexes.invalidate(dir_path_for(pak_path))
+        for tmp in (tmp_pak, tmp_dir):
+            if os.path.exists(tmp):
+                logging.warning(f"Removing leftover {tmp}")
+                os.remove(tmp)
+
+    def plan_mirror(self, source, destination, include_extras=True, state=None):
+        """
+        Collects extraction and copy jobs for every archive and loose file under source.
+        With a state from mirror_recursive, outputs the manifest records as up to date
+        are skipped and every planned output is recorded in state['new'].
+        """
+        os.makedirs(destination, exist_ok=True)
+
+        items = sorted(os.listdir(source))
+        dir_files = archive_bases(items)
+        jobs = []
+
+        for item in items:
+            src_path = os.path.join(source, item)
+            dst_path = os.path.join(destination, item)
+
+            if os.path.isdir(src_path):
+                jobs.extend(self.plan_mirror(src_path, dst_path, include_extras, state))
+            elif is_archive(item, dir_files):
+                files = self._changed_entries(src_path, dst_path[:-4], state) if state else None
+                jobs.extend(self.plan_extraction(src_path, dst_path[:-4], files=files))
+            elif not item.lower().endswith(".dir") and include_extras:
+                if not state or self._loose_changed(src_path, dst_path, state):
+                    jobs.append((copy_loose, src_path, dst_path))
+        return jobs
+
+    @staticmethod
+    def _output_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    def _changed_entries(self, pak_path, output_folder, state):
+        """Entries of an archive whose manifest record (offset, size, header, output size) is stale."""
+        reader = self.reader(pak_path)
+        targets = {}
+        for name, offset, size in self.index(pak_path):
+            targets[safe_entry_path(name)] = (name, offset, size)
+        changed = []
+        for rel_path, (name, offset, size) in targets.items():
+            output_path = os.path.join(output_folder, rel_path)
+            key = os.path.relpath(output_path, state['root']).replace(os.sep, '/')
+            record = [offset, size, bytes(reader.entry(offset, 8)).hex()]
+            old = state['old']['entries'].get(key)
+            if old and old[:3] == record and self._output_size(output_path) == old[3]:
+                state['new']['entries'][key] = old
+                state['skipped'] += 1
+            else:
+                state['new']['entries'][key] = record + [None]
+                state['pending'][(pak_path, name)] = ('entries', key)
+                changed.append({'name': name, 'offset': offset, 'size': size})
+        return changed
+
+    def _loose_changed(self, src_path, dst_path, state):
+        st = os.stat(src_path)
+        key = os.path.relpath(dst_path, state['root']).replace(os.sep, '/')
+        record = [st.st_size, st.st_mtime_ns]
+        old = state['old']['files'].get(key)
+        if old and old[:2] == record and self._output_size(dst_path) == old[2]:
+            state['new']['files'][key] = old
+            state['skipped'] += 1
+            return False
+        state['new']['files'][key] = record + [None]
+        state['pending'][(src_path, src_path)] = ('files', key)
+        return True
+
+    def load_manifest(self, source, destination):
+        """Mirror manifest of destination, or an empty one when missing or made from another source."""
+        empty = {'source': os.path.abspath(source), 'entries': {}, 'files': {}}
+        try:
+            with open(os.path.join(destination, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return empty
+        if manifest.get('source') != empty['source']:
+            return empty
+        manifest.setdefault('entries', {}); manifest.setdefault('files', {})
+        return manifest
+
+    def mirror_recursive(self, source, destination, include_extras=True, incremental=False, prune=False):
+        """
+        Unpacks every archive under source into destination, spreading the
+        batches of all archives over one pool. Returns {'entries', 'bytes', 'errors'}.
+
+        incremental keeps a manifest (MANIFEST_NAME) in destination recording each output's
+        archive offset/size/block header or loose-file size/mtime, and only re-extracts or
+        copies what changed; 'skipped' counts the rest. prune also deletes outputs the
+        manifest knew about that the source no longer produces ('pruned').
+        """
+        if not incremental:
+            return self.run_jobs(self.plan_mirror(source, destination, include_extras))
+
+        state = {'root': destination, 'old': self.load_manifest(source, destination),
+                 'new': {'source': os.path.abspath(source), 'entries': {}, 'files': {}},
+                 'pending': {}, 'skipped': 0}
+        result = self.run_jobs(self.plan_mirror(source, destination, include_extras, state))
+        result['skipped'] = state['skipped']
+
+        failed = {(e['archive'], e['name']) for e in result['errors']}
+        new = state['new']
+        for origin, (section, key) in state['pending'].items():
+            size = None if origin in failed else self._output_size(os.path.join(destination, key))
+            if size is None:
+                del new[section][key]
+            else:
+                new[section][key][-1] = size
+
+        result['pruned'] = 0
+        if prune:
+            for section in ('entries', 'files'):
+                for key in state['old'][section].keys() - new[section].keys():
+                    try:
+                        os.remove(os.path.join(destination, key))
+                        result['pruned'] += 1
+                    except OSError:
+                        pass
+
+        manifest_path = os.path.join(destination, MANIFEST_NAME)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(new, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+        return result
+
+    def scan_archive(self, pak_path):
+        """
+        Decodes the header of every block in one offset-ordered pass over the mapped PAK,
+        without inflating anything. Returns {'archive', 'pak_size', 'entries', 'blocks',
+        'shared', 'zig', 'wrapped', 'raw', 'unknown', 'stored', 'original', 'ratio', 'padding',
+        'gap', 'overlaps', 'out_of_bounds': [names], 'short': [names], 'overlapping': [names]};
+        'short' lists entries smaller than a block header, 'wrapped' counts
+        the zIG blocks holding a zlib stream rather than raw deflate, 'stored' and
+        'original' count every block once, 'gap' is unreferenced bytes that compaction
+        would reclaim, 'padding' the 4-byte alignment between blocks. The report is kept
+        for cached_scan() until the PAK or .DIR changes on disk.
+        """
+        key = self._scan_key(pak_path)
+        blocks = {}
+        for name, offset, size in self.index(pak_path):
+            blocks.setdefault((offset, size), []).append(name)
+        reader = self.reader(pak_path)
+        pak_size = reader.size
+        view = reader.entry(0, pak_size)
+        unpack = struct.Struct("<4sI").unpack_from
+        report = {'archive': pak_path, 'pak_size': pak_size, 'entries': sum(map(len, blocks.values())),
+                  'blocks': len(blocks), 'shared': 0, 'zig': 0, 'wrapped': 0, 'raw': 0, 'unknown': 0, 'stored': 0,
+                  'original': 0, 'ratio': None, 'padding': 0, 'gap': 0, 'overlaps': 0,
+                  'out_of_bounds': [], 'short': [], 'overlapping': []}
+        counts = {b"zIG": 'zig', b"RAW": 'raw', None: 'unknown'}
+        end = 0
+        try:
+            for offset, size in sorted(blocks):
+                names = blocks[(offset, size)]
+                report['shared'] += len(names) - 1
+                if offset + size > pak_size:
+                    report['out_of_bounds'].extend(names)
+                    continue
+                if offset < end:
+                    report['overlaps'] += 1
+                    report['overlapping'].extend(names)
+                elif offset - end < 4 and offset % 4 == 0:
+                    report['padding'] += offset - end
+                else:
+                    report['gap'] += offset - end
+                end = max(end, offset + size)
+                report['stored'] += size
+                if size < 8:
+                    report['short'].extend(names)
+                    continue
+
+                prefix, masked_size = unpack(view, offset)
+                sig = HEADER_SIGS.get(prefix)
+                report[counts[sig]] += 1
+                if sig: report['original'] += masked_size ^ SIZE_MASKS[prefix[0]]
+                if sig == b"zIG" and TorcEngine.deflate_variants(view[offset + 8:offset + 10])[0] > 0:
+                    report['wrapped'] += 1
+        finally:
+            view.release()
+        report['gap'] += pak_size - end
+        if report['original']:
+            report['ratio'] = round(report['stored'] / report['original'], 4)
+        self._scans[os.path.abspath(pak_path)] = (key, report)
+        return report
+
+    @staticmethod
+    def _scan_key(pak_path):
+        return (IndexCache._key(pak_path), IndexCache._key(dir_path_for(pak_path)))
+
+    def cached_scan(self, pak_path):
+        """Last scan_archive() report of an archive while its PAK and .DIR are unchanged, else None."""
+        hit = self._scans.get(os.path.abspath(pak_path))
+        if hit and hit[0] == self._scan_key(pak_path): return hit[1]
+        return None
+
+    def plan_verify(self, pak_path):
+        """
+        Verification jobs for an archive in offset order, plus the errors of entries
+        that point outside the PAK or are smaller than a block header (those are
+        reported without being read).
+        """
+        reader = self.reader(pak_path)
+        pak_size = reader.size
+        jobs, errors, batch, batch_bytes = [], [], [], 0
+        for name, offset, size in sorted(self.index(pak_path), key=lambda e: e[1]):
+            if offset + size > pak_size:
+                errors.append({'name': name, 'offset': offset, 'size': size, 'error': "entry out of bounds"})
+                continue
+            if size < 8:
+                errors.append({'name': name, 'offset': offset, 'size': size, 'error': "block shorter than its header"})
+                continue
+            batch.append((name, offset, size))
+            batch_bytes += size
+            if len(batch) >= BATCH_ENTRIES or batch_bytes >= BATCH_BYTES:
+                jobs.append((verify_batch, reader, batch, self.chunk_size))
+                batch, batch_bytes = [], 0
+        if batch:
+            jobs.append((verify_batch, reader, batch, self.chunk_size))
+        return jobs, errors
+
+    def verify_archives(self, paths):
+        """
+        Checks every entry of every archive for bounds, signature and decoded size, without
+        writing output. The batches of all archives share one pool. Returns one report per
+        archive: {'archive', 'entries', 'stored', 'errors': [{'name', 'offset', 'size', 'error'}]},
+        'stored' being the block bytes read.
+        """
+        reports, owners, jobs = {}, {}, []
+        for pak_path in paths:
+            archive_jobs, errors = self.plan_verify(pak_path)
+            owners[self.reader(pak_path).path] = pak_path
+            reports[pak_path] = {'archive': pak_path, 'entries': len(self.index(pak_path)),
+                                 'stored': sum(size for job in archive_jobs for _, _, size in job[2]),
+                                 'errors': errors}
+            jobs.extend(archive_jobs)
+        for err in self.run_jobs(jobs)['errors']:
+            pak_path = owners[err['archive']]
+            f = self.index(pak_path).lookup(err['name'])
+            reports[pak_path]['errors'].append({'name': err['name'], 'offset': f['offset'],
+                                                'size': f['size'], 'error': err['error']})
+        for report in reports.values():
+            report['errors'].sort(key=lambda e: e['offset'])
+        return list(reports.values())
+
+    def verify_archive(self, pak_path):
+        """verify_archives() for a single archive."""
+        return self.verify_archives([pak_path])[0]
@@ -5,119 +5,21 @@ Utility for Torc Engine .PAK/.DIR archives with Trie indexing and zIG compressio
 """
 
 import os
-import struct
-import zlib
+import time
+import queue
 import shutil
-import random
 import logging
+from itertools import islice
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from threading import Thread
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
-
-class TorcEngine:
-    @staticmethod
-    def rotate_right8(val, bits):
-        return ((val >> bits) | (val << (8 - bits))) & 0xFF
-
-    @staticmethod
-    def create_zig_header(data, compress=True):
-        """
-        zIG format: [key:u8][sig_encrypted:3bytes][size_encrypted:u32][payload]
-        sig = "zIG" (compressed) or "RAW" (uncompressed)
-        size = original uncompressed size
-        meta_key = ror8(key, 3) used for size encryption
-        """
-        key = random.randint(1, 254)
-        final_data = zlib.compress(data, 9) if compress else data
-        sig = b"zIG" if compress else b"RAW"
-        header = bytearray([key])
-        for b in sig: header.append(b ^ key)
-        meta_key = TorcEngine.rotate_right8(key, 3)
-        header.extend([b ^ meta_key for b in struct.pack("<I", len(data))])
-        return header + final_data
-
-    @staticmethod
-    def decompress_zig(raw_data):
-        if len(raw_data) < 8: return raw_data
-        key = raw_data[0]
-        sig = bytes([raw_data[1]^key, raw_data[2]^key, raw_data[3]^key])
-        if sig != b"zIG": return raw_data
-        try: return zlib.decompress(raw_data[8:], -15)
-        except Exception as e:
-            logging.warning(f"zIG decompression failed (wbits=-15): {e}")
-            try: return zlib.decompress(raw_data[8:])
-            except Exception as e2:
-                logging.error(f"zIG decompression failed (default): {e2}")
-                return raw_data
-
-    @staticmethod
-    def get_zig_metadata(pak_path, offset, size):
-        try:
-            with open(pak_path, "rb") as f:
-                f.seek(offset); h = f.read(8)
-                if len(h) < 8: return None
-                key = h[0]; meta_key = TorcEngine.rotate_right8(key, 3)
-                orig_sz = struct.unpack("<I", bytes([h[i]^meta_key for i in range(4, 8)]))[0]
-                return {"orig_size": orig_sz, "key": key}
-        except Exception as e:
-            logging.error(f"Failed to read zIG metadata at {pak_path}+0x{offset:X}: {e}")
-            return None
+from TDR_PAK_Engine import (ArchiveEngine, CompressionPolicy, JobControl, JobCancelled, archive_bases, find_archives,
+                            is_archive, policy_summary, walk_pack_sources)
 
-    @staticmethod
-    def parse_trie_index(path):
-        """
-        Trie format: recursive structure of [char:u8][flags:u8][offset:u32,size:u32]?
-        flags: 0x08=file_entry, 0x40=has_children, 0x80=has_sibling
-        """
-        files = []
-        if not os.path.exists(path): return files
-        try:
-            with open(path, "rb") as f: data = f.read()
-        except Exception as e:
-            logging.error(f"Failed to read trie index {path}: {e}")
-            return []
-        pos = 0
-        def walk(prefix):
-            nonlocal pos
-            while pos < len(data):
-                if pos + 2 > len(data): break
-                c, flags = data[pos], data[pos+1]; pos += 2
-                name = prefix + chr(c)
-                if flags & 0x08:
-                    if pos + 8 > len(data): break
-                    off, sz = struct.unpack("<II", data[pos:pos+8]); pos += 8
-                    files.append({'name': name, 'offset': off, 'size': sz})
-                if flags & 0x40: walk(name)
-                if not (flags & 0x80): break
-        walk("")
-        logging.info(f"Parsed {len(files)} files from {path}")
-        return files
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 
-    @staticmethod
-    def serialize_trie_index(files_list):
-        unique_files = {f['name']: f for f in files_list}
-        tree = {}
-        for name in sorted(unique_files.keys()):
-            f = unique_files[name]
-            curr = tree
-            for i, char in enumerate(name):
-                if char not in curr: curr[char] = {'flags': 0, 'meta': None, 'children': {}}
-                if i == len(name) - 1:
-                    curr[char]['flags'] |= 0x08; curr[char]['meta'] = (f['offset'], f['size'])
-                else:
-                    curr[char]['flags'] |= 0x40; curr = curr[char]['children']
-        def serialize(nodes):
-            out = bytearray(); items = list(nodes.items())
-            for i, (char, info) in enumerate(items):
-                flags = info['flags']
-                if i < len(items) - 1: flags |= 0x80
-                out.append(ord(char)); out.append(flags)
-                if info['meta']: out.extend(struct.pack("<II", *info['meta']))
-                if info['children']: out.extend(serialize(info['children']))
-            return out
-        return serialize(tree)
+SEARCH_LIMIT = 5000
 
 class TDRPAKManager:
     def __init__(self, root):
@@ -130,6 +32,15 @@ class TDRPAKManager:
         self.include_extras = tk.BooleanVar(value=True)
         self.archive_folders = tk.BooleanVar(value=True)
         self.flatten_extract = tk.BooleanVar(value=False)
+        self.dedup_pack = tk.BooleanVar(value=False)
+        self.adaptive_pack = tk.BooleanVar(value=True)
+        self.incremental_mirror = tk.BooleanVar(value=False)
+        self.search_var = tk.StringVar()
+        self.search_regex = tk.BooleanVar(value=False)
+        self.engine = ArchiveEngine(workers=None)
+        self.job = None
+        self.job_events = queue.Queue()
+        self.flat_fills = {}
         
         self.setup_menu()
         self.setup_ui()
@@ -191,6 +102,11 @@ class TDRPAKManager:
         btn_frame = ttk.Frame(src_frame)
         btn_frame.grid(row=2, column=0, columnspan=2, sticky='ew', pady=(5,0))
         ttk.Button(btn_frame, text="New Archive", command=self.action_new_pak).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="Search", command=self.action_search).pack(side=tk.RIGHT)
+        ttk.Checkbutton(btn_frame, text="Regex", variable=self.search_regex).pack(side=tk.RIGHT, padx=5)
+        search_entry = ttk.Entry(btn_frame, textvariable=self.search_var)
+        search_entry.pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=(10,0))
+        search_entry.bind("<Return>", self.action_search)
         
         paned.add(src_frame, weight=1)
 
@@ -198,12 +114,17 @@ class TDRPAKManager:
         ttk.Button(mid_frame, text="Extract →", command=self.action_extract, width=14).pack(pady=5)
         ttk.Button(mid_frame, text="← Pack Into", command=self.action_pack, width=14).pack(pady=5)
         ttk.Button(mid_frame, text="✕ Delete", command=self.action_delete, width=14).pack(pady=5)
+        ttk.Button(mid_frame, text="Compact", command=self.action_compact, width=14).pack(pady=5)
+        ttk.Button(mid_frame, text="Scan", command=self.action_scan, width=14).pack(pady=5)
         ttk.Separator(mid_frame, orient='horizontal').pack(fill='x', pady=15)
         ttk.Button(mid_frame, text="Full Mirror", command=self.action_mirror, width=14).pack(pady=5)
         ttk.Separator(mid_frame, orient='horizontal').pack(fill='x', pady=15)
         ttk.Checkbutton(mid_frame, text="Include loose files", variable=self.include_extras).pack(anchor='w', pady=2)
         ttk.Checkbutton(mid_frame, text="Show archive folders", variable=self.archive_folders, command=self.force_refresh_paks).pack(anchor='w', pady=2)
         ttk.Checkbutton(mid_frame, text="Flatten on extract", variable=self.flatten_extract).pack(anchor='w', pady=2)
+        ttk.Checkbutton(mid_frame, text="Deduplicate on pack", variable=self.dedup_pack).pack(anchor='w', pady=2)
+        ttk.Checkbutton(mid_frame, text="Adaptive compression", variable=self.adaptive_pack).pack(anchor='w', pady=2)
+        ttk.Checkbutton(mid_frame, text="Incremental mirror", variable=self.incremental_mirror).pack(anchor='w', pady=2)
         paned.add(mid_frame, weight=0)
 
         dst_frame = ttk.LabelFrame(paned, text="Target", padding=5)
@@ -224,8 +145,12 @@ class TDRPAKManager:
         paned.add(dst_frame, weight=1)
 
         self.status_var = tk.StringVar(value="Ready")
-        status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor='w')
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.cancel_btn = ttk.Button(status_frame, text="Cancel", command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.RIGHT)
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor='w')
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
     def load_src(self):
         d = filedialog.askdirectory(title="Select Source Folder")
@@ -242,6 +167,7 @@ class TDRPAKManager:
             self.refresh_tree(self.dst_tree, d, False)
 
     def refresh_tree(self, tree, path, is_src):
+        if is_src: self.flat_fills.clear()
         for i in tree.get_children(): tree.delete(i)
         if not path or not os.path.exists(path): return
         root_node = tree.insert("", "end", text=os.path.basename(path), 
@@ -251,13 +177,12 @@ class TDRPAKManager:
     def populate_node(self, tree, parent, path, is_src):
         if not os.path.isdir(path): return
         items = os.listdir(path)
-        dir_files = {i.lower()[:-4] for i in items if i.lower().endswith(".dir")}
+        dir_files = archive_bases(items)
         
         def sort_key(name):
             full_path = os.path.join(path, name)
             if os.path.isdir(full_path): return (0, name.lower())
-            base = name.lower()[:-4] if name.lower().endswith(".pak") else None
-            if base and base in dir_files: return (2, name.lower())
+            if is_archive(name, dir_files): return (2, name.lower())
             return (1, name.lower())
         
         for item in sorted(items, key=sort_key):
@@ -265,16 +190,15 @@ class TDRPAKManager:
             
             full_path = os.path.join(path, item)
             is_dir = os.path.isdir(full_path)
-            base = item.lower()[:-4] if item.lower().endswith(".pak") else None
-            is_archive = base and base in dir_files
+            is_pak = is_archive(item, dir_files)
             
-            ntype = "dir" if is_dir else ("archive" if is_archive else "file")
-            tags = ("archive",) if is_archive else (("extra",) if ntype == "file" else ())
-            icon = "[DIR]" if is_dir else ("[PAK]" if is_archive else "[FILE]")
+            ntype = "dir" if is_dir else ("archive" if is_pak else "file")
+            tags = ("archive",) if is_pak else (("extra",) if ntype == "file" else ())
+            icon = "[DIR]" if is_dir else ("[PAK]" if is_pak else "[FILE]")
             
             node = tree.insert(parent, 'end', text=f"{icon} {item}", 
                              values=(full_path, ntype, item), tags=tags)
-            if is_dir or is_archive:
+            if is_dir or is_pak:
                 tree.insert(node, 'end', text="...")
 
     def on_expand(self, event):
@@ -290,36 +214,84 @@ class TDRPAKManager:
         if values[1] in ["dir", "root"]:
             self.populate_node(self.src_tree, node, values[0], True)
         elif values[1] == "archive":
-            files = TorcEngine.parse_trie_index(values[0][:-4] + ".dir")
+            pak_path = values[0]
             if self.archive_folders.get():
-                self.populate_archive_nested(node, files, values[0])
+                self.with_index(node, pak_path, lambda index: self.populate_archive_dir(node, pak_path, "", index))
+            else:
+                self.with_index(node, pak_path, lambda index: self.populate_archive_flat(node, pak_path, iter(index)))
+        elif values[1] == "vdir":
+            pak_path, prefix = values[0], values[4] + "/"
+            self.with_index(node, pak_path, lambda index: self.populate_archive_dir(node, pak_path, prefix, index))
+
+    def with_index(self, node, pak_path, fill):
+        """
+        Calls fill(index) on the Tk thread. An index that is not in memory yet is parsed on a
+        worker thread while node shows a "loading..." row; refreshing the node drops the result.
+        """
+        index = self.engine.cached_index(pak_path)
+        if index is not None:
+            fill(index)
+            return
+        placeholder = self.src_tree.insert(node, 'end', text="loading...")
+        results = queue.Queue()
+        
+        def load():
+            try:
+                results.put(self.engine.index(pak_path))
+            except Exception as e:
+                logging.exception(f"Loading {pak_path} failed")
+                results.put(e)
+        
+        Thread(target=load, daemon=True).start()
+        self.root.after(50, self.poll_index, placeholder, results, fill)
+
+    def poll_index(self, placeholder, results, fill):
+        try:
+            index = results.get_nowait()
+        except queue.Empty:
+            self.root.after(50, self.poll_index, placeholder, results, fill)
+            return
+        if not self.src_tree.exists(placeholder):
+            return
+        self.src_tree.delete(placeholder)
+        if isinstance(index, Exception):
+            self.status_var.set(f"Failed to read index: {index}")
+        else:
+            fill(index)
+
+    def populate_archive_dir(self, parent, pak_path, prefix, index):
+        """Inserts one virtual folder level; subfolders get a "..." placeholder until expanded."""
+        folders, files = index.list_dir(prefix)
+        items = [(name, None) for name in folders] + [(f['name'][len(prefix):], f) for f in files]
+        for key, f in sorted(items, key=lambda item: item[0]):
+            if f is None:
+                folder_node = self.src_tree.insert(parent, 'end', text=f"[DIR] {key}", 
+                                                  values=(pak_path, "vdir", 0, 0, prefix + key))
+                self.src_tree.insert(folder_node, 'end', text="...")
             else:
-                for f in files:
-                    self.src_tree.insert(node, 'end', text=f"[FILE] {f['name']}", 
-                                       values=(values[0], "vfile", f['offset'], f['size'], f['name']))
-
-    def populate_archive_nested(self, parent, files, pak_path):
-        tree_dict = {}
-        for f in files:
-            parts = f['name'].split('/')
-            current = tree_dict
-            for part in parts[:-1]:
-                if part not in current or not isinstance(current[part], dict):
-                    current[part] = {}
-                current = current[part]
-            current[parts[-1]] = f
-        
-        def build_tree(parent_node, node_dict):
-            for key, value in sorted(node_dict.items()):
-                if isinstance(value, dict) and 'offset' not in value:
-                    folder_node = self.src_tree.insert(parent_node, 'end', text=f"[DIR] {key}", 
-                                                      values=(pak_path, "vdir", 0, 0, key))
-                    build_tree(folder_node, value)
-                else:
-                    self.src_tree.insert(parent_node, 'end', text=f"[FILE] {key}", 
-                                       values=(pak_path, "vfile", value['offset'], value['size'], value['name']))
-        
-        build_tree(parent, tree_dict)
+                self.src_tree.insert(parent, 'end', text=f"[FILE] {key}", 
+                                   values=(pak_path, "vfile", f['offset'], f['size'], f['name']))
+
+    def populate_archive_flat(self, parent, pak_path, entries, chunk=2000):
+        """
+        Inserts a flat listing a chunk per Tk idle slot so the window stays responsive.
+        A newer listing of the same node (or its removal) stops the old one.
+        """
+        self.flat_fills[parent] = entries
+        added = 0
+        if self.src_tree.exists(parent):
+            for name, offset, size in islice(entries, chunk):
+                self.src_tree.insert(parent, 'end', text=f"[FILE] {name}", 
+                                   values=(pak_path, "vfile", offset, size, name))
+                added += 1
+        if added == chunk:
+            self.root.after(1, self.continue_flat, parent, pak_path, entries, chunk)
+        else:
+            del self.flat_fills[parent]
+
+    def continue_flat(self, parent, pak_path, entries, chunk):
+        if self.flat_fills.get(parent) is entries:
+            self.populate_archive_flat(parent, pak_path, entries, chunk)
 
     def force_refresh_paks(self):
         for node in self.src_tree.get_children():
@@ -328,6 +300,7 @@ class TDRPAKManager:
     def _recursive_refresh_paks(self, node):
         values = self.src_tree.item(node, "values")
         if values and values[1] == "archive" and self.src_tree.item(node, "open"):
+            self.flat_fills.pop(node, None)
             for child in self.src_tree.get_children(node):
                 self.src_tree.delete(child)
             self.src_tree.insert(node, 'end', text="...")
@@ -355,7 +328,7 @@ class TDRPAKManager:
         
         if len(values) > 4 and values[1] == "vfile":
             pak_path, offset, size, name = values[0], int(values[2]), int(values[3]), values[4]
-            info = TorcEngine.get_zig_metadata(pak_path, offset, size)
+            info = self.engine.entry_info(pak_path, offset, size)
             
             if info:
                 ratio = (size / info['orig_size']) * 100 if info['orig_size'] > 0 else 0
@@ -364,9 +337,27 @@ class TDRPAKManager:
                 msg = f"{name} | Size: {size:,} bytes | Offset: 0x{offset:X}"
             
             self.status_var.set(msg)
+        elif values and values[1] == "archive":
+            report = self.engine.cached_scan(values[0])
+            if report:
+                self.status_var.set(self.scan_summary(report))
+            else:
+                try:
+                    size = f"{os.path.getsize(values[0]):,} bytes"
+                except OSError as e:
+                    size = str(e)
+                self.status_var.set(f"{os.path.basename(values[0])} | {size} | Scan for block statistics")
         else:
             self.status_var.set("Ready")
 
+    @staticmethod
+    def scan_summary(r):
+        ratio = f" ({r['ratio']:.1%})" if r['ratio'] is not None else ""
+        bad = len(r['out_of_bounds']) + len(r['short']) + len(r['overlapping'])
+        return (f"{os.path.basename(r['archive'])} | {r['entries']:,} entries | {r['zig']:,} zIG, {r['raw']:,} RAW | "
+                f"Stored: {r['stored']:,} / Original: {r['original']:,} bytes{ratio} | "
+                f"Unreferenced: {r['gap']:,} bytes" + (f" | {bad} bad entries" if bad else ""))
+
     def action_new_pak(self):
         node = self.src_tree.focus()
         values = self.src_tree.item(node, "values")
@@ -380,13 +371,7 @@ class TDRPAKManager:
         )
         
         if filepath:
-            if not filepath.lower().endswith(".pak"):
-                filepath += ".pak"
-            with open(filepath, "wb") as f:
-                pass
-            with open(filepath[:-4] + ".dir", "wb") as f:
-                pass
-            logging.info(f"Created new archive: {filepath}")
+            self.engine.new_archive(filepath)
             self.refresh_tree(self.src_tree, self.src_root, True)
 
     def action_extract(self):
@@ -395,51 +380,83 @@ class TDRPAKManager:
             messagebox.showinfo("Extract", "No items selected")
             return
         
-        count = 0
+        tasks = []
         for node in selections:
             values = self.src_tree.item(node, "values")
+            if values and values[1] == "search":
+                tasks.extend((self.src_tree.item(hit, "values"), "") for hit in self.src_tree.get_children(node))
+                continue
             text = self.src_tree.item(node, "text")
             name = text.split("] ", 1)[1] if "]" in text else text
-            
-            if values[1] == "vfile":
-                self.extract_vfile(values[0], values[2], values[3], values[4], self.dst_root)
-                count += 1
-            elif values[1] == "archive":
-                self.unpack_pak(values[0], os.path.join(self.dst_root, name[:-4]))
-                count += 1
-            elif values[1] == "dir":
-                self.mirror_recursive(values[0], os.path.join(self.dst_root, values[2]))
-                count += 1
-            elif values[1] == "file":
-                shutil.copy2(values[0], self.dst_root)
-                count += 1
-        
-        self.refresh_tree(self.dst_tree, self.dst_root, False)
-        self.status_var.set(f"Extracted {count} item(s)")
-
-    def extract_vfile(self, pak_path, offset, size, name, output_dir):
-        safe_name = os.path.normpath(name).lstrip(os.sep).replace('..', '__')
-        
-        if self.flatten_extract.get():
-            safe_name = os.path.basename(safe_name)
-        
-        with open(pak_path, "rb") as pak_file:
-            pak_file.seek(int(offset))
-            raw_data = pak_file.read(int(size))
-            decompressed = TorcEngine.decompress_zig(raw_data)
-            
-            output_path = os.path.join(output_dir, safe_name.replace("/", os.sep))
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-            with open(output_path, "wb") as out_file:
-                out_file.write(decompressed)
-            
-            logging.info(f"Extracted: {safe_name} ({len(decompressed):,} bytes)")
+            tasks.append((values, name))
+        flatten = self.flatten_extract.get()
+        include_extras = self.include_extras.get()
+        dst_root = self.dst_root
+        
+        def work():
+            count = 0
+            errors = []
+            for values, name in tasks:
+                if values[1] == "vfile":
+                    written = self.engine.extract_vfile(values[0], values[2], values[3], values[4], dst_root, flatten)
+                    self.engine.progress(1, written)
+                    count += 1
+                elif values[1] == "vdir":
+                    files = list(self.engine.index(values[0]).iter_prefix(values[4] + "/"))
+                    result = self.engine.unpack_pak(values[0], dst_root, flatten, files)
+                    errors.extend(result['errors'])
+                    count += 1
+                elif values[1] == "archive":
+                    result = self.engine.unpack_pak(values[0], os.path.join(dst_root, name[:-4]), flatten)
+                    errors.extend(result['errors'])
+                    count += 1
+                elif values[1] == "dir":
+                    result = self.engine.mirror_recursive(values[0], os.path.join(dst_root, values[2]), include_extras)
+                    errors.extend(result['errors'])
+                    count += 1
+                elif values[1] == "file":
+                    shutil.copy2(values[0], dst_root)
+                    self.engine.progress(1, os.path.getsize(values[0]))
+                    count += 1
+            return count, errors
+        
+        def done(outcome):
+            count, errors = outcome
+            self.refresh_tree(self.dst_tree, self.dst_root, False)
+            self.status_var.set(f"Extracted {count} item(s)")
+            self.report_errors("Extract", errors)
+        
+        self.start_job("Extracting", work, done, lambda: self.refresh_tree(self.dst_tree, self.dst_root, False))
 
-    def unpack_pak(self, pak_path, output_folder):
-        files = TorcEngine.parse_trie_index(pak_path[:-4] + ".dir")
-        for f in files:
-            self.extract_vfile(pak_path, f['offset'], f['size'], f['name'], output_folder)
+    def action_search(self, event=None):
+        """
+        Finds entries by glob (or regex) in every archive under the source folder and lists
+        them in a "Search" node at the top of the tree; select it or its hits to extract.
+        """
+        pattern = self.search_var.get().strip()
+        if not pattern or not self.src_root:
+            return
+        regex = self.search_regex.get()
+        src_root = self.src_root
+        
+        def work():
+            return self.engine.search(find_archives(src_root), pattern, regex, True, SEARCH_LIMIT + 1)
+        
+        def done(hits):
+            for node in self.src_tree.get_children():
+                if self.src_tree.item(node, "values")[1] == "search":
+                    self.src_tree.delete(node)
+            shown = hits[:SEARCH_LIMIT]
+            count = f"first {SEARCH_LIMIT:,} hits" if len(hits) > SEARCH_LIMIT else f"{len(hits):,} hits"
+            node = self.src_tree.insert("", 0, text=f"[SEARCH] {pattern} ({count})",
+                                        values=(src_root, "search", pattern), open=True)
+            for f in shown:
+                where = os.path.relpath(f['archive'], src_root)
+                self.src_tree.insert(node, 'end', text=f"[FILE] {f['name']}  ({where})",
+                                     values=(f['archive'], "vfile", f['offset'], f['size'], f['name']))
+            self.status_var.set(f"Search '{pattern}': {count}")
+        
+        self.start_job("Searching", work, done)
 
     def action_pack(self):
         selected = self.src_tree.focus()
@@ -449,12 +466,13 @@ class TDRPAKManager:
             messagebox.showwarning("Pack", "Select a [PAK] archive in the source tree")
             return
         
-        compress = messagebox.askyesno("Compression", "Enable zIG compression?")
+        if self.adaptive_pack.get():
+            compress = CompressionPolicy(level=self.engine.level)
+        else:
+            compress = messagebox.askyesno("Compression", "Enable zIG compression?")
         pak_path = selected_values[0]
-        dir_path = pak_path[:-4] + ".dir"
         
-        existing_files = TorcEngine.parse_trie_index(dir_path)
-        existing_names = {f['name'] for f in existing_files}
+        existing_names = {f['name'] for f in self.engine.list_entries(pak_path)}
         new_files = []
         
         dst_selections = self.dst_tree.selection()
@@ -463,59 +481,38 @@ class TDRPAKManager:
             return
         
         for node in dst_selections:
-            src_path, node_type, relative_name = self.dst_tree.item(node, "values")[:3]
+            src_path, node_type = self.dst_tree.item(node, "values")[:2]
+            if node_type == "root":
+                continue
             
-            if node_type == "dir":
-                for root, _, filenames in os.walk(src_path):
-                    for filename in filenames:
-                        file_path = os.path.join(root, filename)
-                        rel_path = os.path.relpath(file_path, os.path.dirname(src_path)).replace(os.sep, '/')
-                        
-                        if rel_path in existing_names:
-                            if not messagebox.askyesno("Conflict", f"'{rel_path}' already exists. Overwrite?"):
-                                continue
-                            existing_files = [f for f in existing_files if f['name'] != rel_path]
-                        
-                        new_files.append((file_path, rel_path))
-            
-            elif os.path.isfile(src_path):
-                if relative_name in existing_names:
-                    if not messagebox.askyesno("Conflict", f"'{relative_name}' already exists. Overwrite?"):
+            for file_path, rel_path in walk_pack_sources(src_path):
+                if rel_path in existing_names:
+                    if not messagebox.askyesno("Conflict", f"'{rel_path}' already exists. Overwrite?"):
                         continue
-                    existing_files = [f for f in existing_files if f['name'] != relative_name]
-                
-                new_files.append((src_path, relative_name))
+                new_files.append((file_path, rel_path))
         
         if not new_files:
             messagebox.showinfo("Pack", "No files to pack")
             return
         
-        with open(pak_path, "ab") as pak_file:
-            for file_path, rel_name in new_files:
-                with open(file_path, "rb") as f:
-                    data = f.read()
-                
-                packed = TorcEngine.create_zig_header(data, compress)
-                
-                current_pos = pak_file.tell()
-                padding = (4 - (current_pos % 4)) % 4
-                if padding:
-                    pak_file.write(b"\x00" * padding)
-                
-                offset = pak_file.tell()
-                pak_file.write(packed)
-                
-                existing_files.append({'name': rel_name, 'offset': offset, 'size': len(packed)})
-                logging.info(f"Packed: {rel_name} at 0x{offset:X} (padded: {padding} bytes)")
-        
-        with open(dir_path, "wb") as dir_file:
-            dir_file.write(TorcEngine.serialize_trie_index(existing_files))
-        
-        messagebox.showinfo("Success", f"Added {len(new_files)} file(s) to archive")
-        self.refresh_tree(self.src_tree, self.src_root, True)
-        self.status_var.set(f"Packed {len(new_files)} file(s)")
+        dedup = self.dedup_pack.get()
+        
+        def done(added):
+            messagebox.showinfo("Success", f"Added {len(new_files)} file(s) to archive")
+            self.refresh_tree(self.src_tree, self.src_root, True)
+            msg = f"Packed {len(new_files)} file(s)"
+            if isinstance(compress, CompressionPolicy):
+                s = policy_summary(added)
+                msg += (f" | {s['raw']} stored RAW, {s['fast_level']} at fast level | "
+                        f"~{s['saved_seconds']:.1f}s deflate skipped, {s['extra_bytes']:+,} bytes")
+            self.status_var.set(msg)
+        
+        self.start_job("Packing", lambda: self.engine.pack_files(pak_path, new_files, compress, dedup), done)
 
     def action_delete(self):
+        if self.job:
+            messagebox.showinfo("Delete", "Another operation is still running")
+            return
         selections = self.src_tree.selection()
         if not selections:
             messagebox.showinfo("Delete", "No items selected")
@@ -534,38 +531,40 @@ class TDRPAKManager:
             messagebox.showinfo("Delete", "Select files or folders from archives")
             return
         
-        if not messagebox.askyesno("Delete", f"Remove selected items from {len(archives_to_update)} archive(s)?\n\nNote: PAK file size will not shrink."):
+        if not messagebox.askyesno("Delete", f"Remove selected items from {len(archives_to_update)} archive(s)?\n\nNote: PAK file size will not shrink until the archive is compacted."):
             return
         
         for pak_path, targets in archives_to_update.items():
-            dir_path = pak_path[:-4] + ".dir"
-            files = TorcEngine.parse_trie_index(dir_path)
-            
-            new_files = []
-            removed_count = 0
-            for f in files:
-                keep = True
-                for target_path, target_type in targets:
-                    if target_type == "vfile" and f['name'] == target_path:
-                        keep = False
-                        removed_count += 1
-                        break
-                    if target_type == "vdir" and f['name'].startswith(target_path + "/"):
-                        keep = False
-                        removed_count += 1
-                        break
-                if keep:
-                    new_files.append(f)
-            
-            with open(dir_path, "wb") as dir_file:
-                dir_file.write(TorcEngine.serialize_trie_index(new_files))
-            
-            logging.info(f"Removed {removed_count} entries from {os.path.basename(pak_path)}")
+            self.engine.delete_entries(pak_path, targets)
         
         messagebox.showinfo("Success", "Items removed from index")
         self.refresh_tree(self.src_tree, self.src_root, True)
         self.status_var.set(f"Deleted from {len(archives_to_update)} archive(s)")
 
+    def action_compact(self):
+        selected_values = self.src_tree.item(self.src_tree.focus(), "values")
+        if not selected_values or selected_values[1] != "archive":
+            messagebox.showwarning("Compact", "Select a [PAK] archive in the source tree")
+            return
+        pak_path = selected_values[0]
+        
+        def done(result):
+            self.refresh_tree(self.src_tree, self.src_root, True)
+            self.status_var.set(f"Compacted {os.path.basename(result['archive'])}: "
+                                f"{result['reclaimed']:,} bytes reclaimed ({result['new_size']:,} bytes)")
+        
+        self.start_job("Compacting", lambda: self.engine.compact_archive(pak_path), done)
+
+    def action_scan(self):
+        """Reads every block header of the selected archive; the report stays on the status bar."""
+        selected_values = self.src_tree.item(self.src_tree.focus(), "values")
+        if not selected_values or selected_values[1] != "archive":
+            messagebox.showwarning("Scan", "Select a [PAK] archive in the source tree")
+            return
+        pak_path = selected_values[0]
+        self.start_job("Scanning", lambda: self.engine.scan_archive(pak_path),
+                       lambda report: self.status_var.set(self.scan_summary(report)))
+
     def action_mirror(self):
         if not self.src_root:
             messagebox.showwarning("Mirror", "No source folder selected")
@@ -575,32 +574,83 @@ class TDRPAKManager:
             messagebox.showerror("Error", "Source and target folders must be different")
             return
         
-        self.mirror_recursive(self.src_root, self.dst_root)
-        self.refresh_tree(self.dst_tree, self.dst_root, False)
-        messagebox.showinfo("Mirror", "Mirror operation complete")
-        self.status_var.set("Mirror complete")
-
-    def mirror_recursive(self, source, destination):
-        if not os.path.exists(destination):
-            os.makedirs(destination)
+        src_root, dst_root = self.src_root, self.dst_root
+        include_extras, incremental = self.include_extras.get(), self.incremental_mirror.get()
         
-        items = os.listdir(source)
-        dir_files = {i.lower()[:-4] for i in items if i.lower().endswith(".dir")}
+        def done(result):
+            self.refresh_tree(self.dst_tree, self.dst_root, False)
+            if not self.report_errors("Mirror", result['errors']):
+                messagebox.showinfo("Mirror", "Mirror operation complete")
+            self.status_var.set(f"Mirror complete: {result['entries']:,} entries, {result['bytes']:,} bytes")
         
-        for item in items:
-            src_path = os.path.join(source, item)
-            dst_path = os.path.join(destination, item)
-            
-            if os.path.isdir(src_path):
-                self.mirror_recursive(src_path, dst_path)
-            else:
-                base = item.lower()[:-4] if item.lower().endswith(".pak") else None
-                is_archive = base and base in dir_files
-                
-                if is_archive:
-                    self.unpack_pak(src_path, dst_path[:-4])
-                elif not item.lower().endswith(".dir") and self.include_extras.get():
-                    shutil.copy2(src_path, dst_path)
+        self.start_job("Mirroring", lambda: self.engine.mirror_recursive(src_root, dst_root, include_extras, incremental),
+                       done, lambda: self.refresh_tree(self.dst_tree, self.dst_root, False))
+
+    def start_job(self, label, work, on_done, on_cancel=None):
+        """
+        Runs work() on a background thread with self.engine.job set, so the engine
+        reports progress and honours Cancel. on_done(result) runs on the Tk thread.
+        """
+        if self.job:
+            messagebox.showinfo(label, "Another operation is still running")
+            return False
+        job = JobControl()
+        self.job = job
+        self.engine.job = job
+        self.cancel_btn.config(state=tk.NORMAL)
+        
+        def run():
+            try:
+                self.job_events.put(("done", work()))
+            except JobCancelled:
+                self.job_events.put(("cancelled", None))
+            except Exception as e:
+                logging.exception(f"{label} failed")
+                self.job_events.put(("error", e))
+        
+        Thread(target=run, daemon=True).start()
+        self.poll_job(label, time.perf_counter(), on_done, on_cancel)
+        return True
+
+    def poll_job(self, label, started, on_done, on_cancel):
+        """Refreshes the status bar from the job counters until the worker reports back."""
+        try:
+            kind, payload = self.job_events.get_nowait()
+        except queue.Empty:
+            entries, nbytes, total = self.job.snapshot()
+            elapsed = time.perf_counter() - started
+            rate = nbytes / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+            of_total = f" / {total:,}" if total else ""
+            cancelling = " - cancelling..." if self.job.cancelled else ""
+            self.status_var.set(f"{label}: {entries:,}{of_total} entries, {nbytes:,} bytes ({rate:.1f} MB/s){cancelling}")
+            self.root.after(100, self.poll_job, label, started, on_done, on_cancel)
+            return
+        
+        self.job = None
+        self.engine.job = None
+        self.cancel_btn.config(state=tk.DISABLED)
+        if kind == "done":
+            on_done(payload)
+        elif kind == "cancelled":
+            if on_cancel:
+                on_cancel()
+            self.status_var.set(f"{label} cancelled")
+        else:
+            self.status_var.set(f"{label} failed")
+            messagebox.showerror(label, str(payload))
+
+    def cancel_job(self):
+        if self.job:
+            self.job.cancel()
+
+    def report_errors(self, title, errors):
+        if not errors:
+            return False
+        lines = [f"{os.path.basename(e['archive'])}: {e['name']}: {e['error']}" for e in errors[:10]]
+        if len(errors) > 10:
+            lines.append(f"... and {len(errors) - 10} more")
+        messagebox.showwarning(title, f"{len(errors)} entries failed:\n\n" + "\n".join(lines))
+        return True
 
 if __name__ == "__main__":
     root = tk.Tk()